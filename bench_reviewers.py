@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import tracemalloc
+import contextlib
+from typing import Dict, Any, List, Callable
+
+from git_utils import STREAM_CHUNK_SIZE, stream_json
+from mention_index import find_reviewers
+from ping_reviewers import check_pr
+from check_pr_is_ready import is_pr_ready
+from models import parse_time
+
+
+def timestamp(rng: random.Random) -> str:
+    t = datetime.datetime(2021, 1, 1) + datetime.timedelta(
+        seconds=rng.randrange(365 * 24 * 3600)
+    )
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def comment_body(rng: random.Random, lines: int, cc_every: int) -> str:
+    body = []
+    for i in range(lines):
+        if i % cc_every == 0:
+            users = " ".join(f"@user-{rng.randrange(500)}" for _ in range(3))
+            body.append(f"cc {users}")
+        else:
+            body.append("Lorem ipsum dolor sit amet, consectetur adipiscing elit " * 2)
+    return "\n".join(body)
+
+
+def make_pr(
+    rng: random.Random, number: int, reviews: int, comments: int, body_lines: int
+) -> Dict[str, Any]:
+    """
+    A PR shaped like a prs_by_number_query result
+    """
+
+    def comment(i: int) -> Dict[str, Any]:
+        return {
+            "id": f"C_{number}_{i}",
+            "authorAssociation": "CONTRIBUTOR",
+            "bodyText": comment_body(rng, body_lines, 5),
+            "updatedAt": timestamp(rng),
+            "author": {"login": f"user-{rng.randrange(500)}"},
+        }
+
+    return {
+        "number": number,
+        "url": f"https://github.com/owner/repo/pull/{number}",
+        "body": comment_body(rng, body_lines, 5),
+        "isDraft": False,
+        "state": "OPEN",
+        "updatedAt": timestamp(rng),
+        "publishedAt": "2021-01-01T00:00:00Z",
+        "author": {"login": "author"},
+        "reviews": {
+            "nodes": [
+                {
+                    "author": {"login": f"user-{rng.randrange(500)}"},
+                    "comments": {
+                        "nodes": [comment(r * comments + c) for c in range(comments)]
+                    },
+                }
+                for r in range(reviews)
+            ]
+        },
+        "comments": {"nodes": [comment(-i - 1) for i in range(comments)]},
+    }
+
+
+def make_ready_pr(number: int) -> Dict[str, Any]:
+    """
+    An approved PR with a passing rollup, so is_pr_ready has to fetch and
+    check every context
+    """
+    return {
+        "number": number,
+        "reviewDecision": "APPROVED",
+        "commits": {
+            "nodes": [
+                {
+                    "commit": {
+                        "oid": f"{number:040x}",
+                        "statusCheckRollup": {"state": "SUCCESS"},
+                    }
+                }
+            ]
+        },
+    }
+
+
+class FakeContexts:
+    """
+    Stands in for GitHubRepo in is_pr_ready, serving pages of passing checks
+    """
+
+    def __init__(self, checks: int):
+        self.user = "owner"
+        self.repo = "repo"
+        self.checks = checks
+
+    def graphql(self, query: str) -> Dict[str, Any]:
+        start = 0
+        if 'after:"' in query:
+            start = int(query.split('after:"')[1].split('"')[0])
+        end = min(self.checks, start + 100)
+        nodes = []
+        for i in range(start, end):
+            if i % 2 == 0:
+                nodes.append({"context": f"ci/{i}", "state": "SUCCESS"})
+            else:
+                nodes.append(
+                    {
+                        "name": f"job-{i}",
+                        "status": "COMPLETED",
+                        "conclusion": "SUCCESS",
+                        "checkSuite": {"workflowRun": {"workflow": {"name": "CI"}}},
+                    }
+                )
+        contexts = {
+            "pageInfo": {"hasNextPage": end < self.checks, "endCursor": str(end)},
+            "nodes": nodes,
+        }
+        return {
+            "data": {
+                "repository": {"object": {"statusCheckRollup": {"contexts": contexts}}}
+            }
+        }
+
+
+def stream_page(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a PRsByNumber response the way ping_reviewers does, from chunks the
+    size GitHubRepo reads
+    """
+    chunks = (
+        body[i : i + STREAM_CHUNK_SIZE]
+        for i in range(0, len(body), STREAM_CHUNK_SIZE)
+    )
+    return dict(stream_json(chunks, ["data", "repository"], {}))
+
+
+def measure(fn: Callable[[Any], Any], items: List[Any], repeat: int) -> Dict[str, float]:
+    """
+    Run 'fn' over every item 'repeat' times, reporting the best throughput and
+    the allocations of one pass
+    """
+    sink = io.StringIO()
+    best = None
+    with contextlib.redirect_stdout(sink):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                fn(item)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+            sink.seek(0)
+            sink.truncate()
+
+        tracemalloc.start()
+        for item in items:
+            fn(item)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return {
+        "ops_per_sec": len(items) / best,
+        "peak_kb": peak / 1024,
+        "live_blocks": blocks,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(args.seed)
+    print(
+        f"Generating {args.prs} PRs with {args.reviews} reviews x "
+        f"{args.comments} comments..."
+    )
+    prs = [
+        make_pr(rng, i, args.reviews, args.comments, args.body_lines)
+        for i in range(args.prs)
+    ]
+    bodies = [pr["body"] for pr in prs]
+    timestamps = [
+        c["updatedAt"]
+        for pr in prs
+        for review in pr["reviews"]["nodes"]
+        for c in review["comments"]["nodes"]
+    ]
+    ready_prs = [make_ready_pr(i) for i in range(args.prs)]
+    contexts = FakeContexts(args.checks)
+    # One PR with a lot of review activity, so it spans many chunks
+    heavy = make_pr(rng, 0, args.heavy_reviews, args.heavy_reviews, args.body_lines)
+    pages = [json.dumps({"data": {"repository": {"pr0": heavy}}}).encode()] * 3
+
+    benchmarks = {
+        "check_pr": (check_pr, prs),
+        "find_reviewers": (find_reviewers, bodies),
+        "strptime": (
+            lambda t: datetime.datetime.strptime(t, "%Y-%m-%dT%H:%M:%SZ"),
+            timestamps,
+        ),
+        "parse_time": (parse_time, timestamps),
+        "is_pr_ready": (lambda pr: is_pr_ready(pr, contexts), ready_prs),
+        "stream_json": (stream_page, pages),
+        "json.loads": (json.loads, pages),
+    }
+
+    results = {}
+    for name, (fn, items) in benchmarks.items():
+        if args.only is not None and name not in args.only:
+            continue
+        results[name] = measure(fn, items, args.repeat)
+        r = results[name]
+        print(
+            f"{name:>16}: {r['ops_per_sec']:>12.1f} ops/s  "
+            f"peak {r['peak_kb']:>10.1f} KiB  {r['live_blocks']:>8} live blocks"
+        )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["ops_per_sec"]
+        change = r["ops_per_sec"] / old - 1
+        print(f"{name:>16}: {change * 100:+.1f}% vs baseline")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    help = "Benchmark the PR evaluation hot paths on synthetic GraphQL data"
+    parser = argparse.ArgumentParser(description=help)
+    parser.add_argument("--prs", type=int, default=1000)
+    parser.add_argument("--reviews", type=int, default=10)
+    parser.add_argument("--comments", type=int, default=10)
+    parser.add_argument("--body-lines", type=int, default=20)
+    parser.add_argument("--checks", type=int, default=250)
+    parser.add_argument(
+        "--heavy-reviews",
+        type=int,
+        default=100,
+        help="reviews (and comments per review) on the PR the decoders run on",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="only run these benchmarks")
+    parser.add_argument(
+        "--baseline",
+        default="bench_baseline.json",
+        help="results to compare against (written with --save-baseline)",
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="write results to --baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="fraction of throughput a benchmark can lose before it's flagged",
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print("Regressions:", ", ".join(regressions))
+            sys.exit(1)
@@ -17,126 +17,343 @@
 # under the License.
 
 import os
+import sys
 import json
+import time
 import argparse
-import subprocess
-import re
-from urllib import request
+import threading
 from urllib import error
-from typing import Dict, Tuple, Any, List
-
-
-
-class GitHubRepo:
-    def __init__(self, user, repo, token):
-        self.token = token
-        self.user = user
-        self.repo = repo
-        self.base = f"https://api.github.com/repos/{user}/{repo}/"
-
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.token}",
-        }
-
-    def graphql(self, query: str) -> Dict[str, Any]:
-        return self._post("https://api.github.com/graphql", {"query": query})
-
-    def _post(self, full_url: str, body: Dict[str, Any]) -> Dict[str, Any]:
-        print("Requesting", full_url)
-        req = request.Request(full_url, headers=self.headers(), method="POST")
-        req.add_header("Content-Type", "application/json; charset=utf-8")
-        data = json.dumps(body)
-        data = data.encode("utf-8")
-        req.add_header("Content-Length", len(data))
-
-        with request.urlopen(req, data) as response:
-            response = json.loads(response.read())
-        return response
-
-    def post(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        return self._post(self.base + url, data)
-
-    def get(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers())
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-    def delete(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers(), method="DELETE")
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-
-def parse_remote(remote: str) -> Tuple[str, str]:
+from typing import Dict, Any, List, Optional, Set, TextIO, Tuple
+
+from git_utils import (
+    GitHubRepo,
+    ResponseCache,
+    Telemetry,
+    TokenPool,
+    WriteScheduler,
+    parse_remote,
+    git,
+)
+from mention_index import MentionIndex, body_version, find_reviewers
+
+
+# pull_request actions that cc_bot.yml runs on
+CC_ACTIONS = {"assigned", "opened", "synchronize", "reopened"}
+
+PER_PAGE = 100
+
+
+def get_pages(github: GitHubRepo, url: str) -> List[Dict[str, Any]]:
+    """
+    Every item of a paginated REST list, where 'url' already ends in ? or &
+    """
+    items = []
+    page = 1
+    while True:
+        batch = github.get(f"{url}per_page={PER_PAGE}&page={page}")
+        items += batch
+        if len(batch) < PER_PAGE:
+            return items
+        page += 1
+
+
+class Collaborators:
     """
-    Get a GitHub (user, repo) pair out of a git remote
+    Who can be asked for a review on a repo: its collaborators' logins and its
+    teams' slugs, lowercased. GitHub rejects a whole review request if any one
+    of them can't review, so cc'ed handles are checked against this first.
+    Fetched in pages of 100 and kept (in memory and, if 'path' is given, on
+    disk) for 'ttl' seconds.
     """
-    if remote.startswith("https://"):
-        # Parse HTTP remote
-        parts = remote.split("/")
-        if len(parts) < 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return parts[-2], parts[-1].replace(".git", "")
+
+    def __init__(
+        self, github: GitHubRepo, path: Optional[str] = None, ttl: float = 3600
+    ):
+        self.github = github
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetched_at = 0.0
+        # None if the token can't list collaborators, so nothing is filtered
+        self._users: Optional[Set[str]] = set()
+        self._teams: Set[str] = set()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("repo") == self.full_name():
+                self._fetched_at = saved["fetched_at"]
+                self._users = (
+                    None if saved["users"] is None else set(saved["users"])
+                )
+                self._teams = set(saved["teams"])
+
+    def full_name(self) -> str:
+        return f"{self.github.user}/{self.github.repo}"
+
+    def refresh(self) -> None:
+        try:
+            users = get_pages(self.github, "collaborators?affiliation=all&")
+            self._users = set(user["login"].lower() for user in users)
+        except error.HTTPError as e:
+            # Listing collaborators needs push access
+            print(f"Unable to list collaborators ({e}), not filtering reviewers")
+            self._users = None
+        try:
+            teams = get_pages(self.github, "teams?")
+        except error.HTTPError as e:
+            # Repos owned by a user rather than an org have no teams, and the
+            # token may not be allowed to list them
+            print(f"Unable to list teams ({e}), only requesting users")
+            teams = []
+        self._teams = set(team["slug"].lower() for team in teams)
+        self._fetched_at = time.time()
+        if self._users is not None:
+            print(
+                f"Fetched {len(self._users)} collaborators and {len(self._teams)} "
+                f"teams for {self.full_name()}"
+            )
+        if self.path is not None:
+            with open(self.path, "w") as f:
+                json.dump(
+                    {
+                        "repo": self.full_name(),
+                        "fetched_at": self._fetched_at,
+                        "users": None if self._users is None else sorted(self._users),
+                        "teams": sorted(self._teams),
+                    },
+                    f,
+                )
+
+    def split(self, handles: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Sort cc'ed handles into (users, teams, neither)
+        """
+        with self._lock:
+            if time.time() - self._fetched_at > self.ttl:
+                self.refresh()
+            users, teams, unknown = [], [], []
+            for handle in handles:
+                if handle.lower() in self._teams:
+                    teams.append(handle)
+                elif self._users is None or handle.lower() in self._users:
+                    users.append(handle)
+                else:
+                    unknown.append(handle)
+            return users, teams, unknown
+
+
+def requested_reviewers(github: GitHubRepo, pr: Dict[str, Any]) -> Set[str]:
+    """
+    Lowercased logins (and team slugs) of everyone whose review is already
+    requested on 'pr', taken from the webhook payload when it has them
+    """
+    if "requested_reviewers" in pr:
+        users = pr["requested_reviewers"]
+        teams = pr.get("requested_teams", [])
     else:
-        # Parse SSH remote
-        m = re.search(r":(.*)/(.*)\.git", remote)
-        if m is None or len(m.groups()) != 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return m.groups()
+        requested = github.get(f"pulls/{pr['number']}/requested_reviewers")
+        users = requested["users"]
+        teams = requested.get("teams", [])
+    return set(user["login"].lower() for user in users) | set(
+        team["slug"].lower() for team in teams
+    )
 
 
-def git(command):
-    proc = subprocess.run(["git"] + command, stdout=subprocess.PIPE, check=True)
-    return proc.stdout.decode().strip()
+def reviewed_by(github: GitHubRepo, number: int) -> Set[str]:
+    """
+    Lowercased logins of everyone who has submitted a review on PR 'number'
+    """
+    reviews = get_pages(github, f"pulls/{number}/reviews?")
+    return set(r["user"]["login"].lower() for r in reviews if r["user"] is not None)
 
 
+def add_reviewers(
+    github: GitHubRepo,
+    pr: Dict[str, Any],
+    mentions: Optional[MentionIndex] = None,
+    collaborators: Optional[Collaborators] = None,
+) -> None:
+    number = pr["number"]
+    body = pr["body"]
+    if body is None:
+        body = ""
 
-def find_reviewers(body: str) -> List[str]:
     print(f"Parsing body:\n{body}")
-    matches = re.findall(r'(cc( @[-A-Za-z0-9]+)+)', body, flags=re.MULTILINE)
-    matches = [full for full, last in matches]
+    if mentions is None:
+        to_add = find_reviewers(body)
+    else:
+        to_add = mentions.reviewers(pr["node_id"], body_version(body), body)
+
+    # GitHub rejects the whole request if it includes the PR's author
+    author = pr["user"]["login"].lower()
+    to_add = [login for login in to_add if login.lower() != author]
+
+    # Most events (e.g. pushes) don't change the cc line, so only request
+    # reviews from anyone who hasn't been requested yet
+    requested = requested_reviewers(github, pr)
+    to_add = [login for login in to_add if login.lower() not in requested]
+    if len(to_add) == 0:
+        print("Everyone cc'ed already has a review requested")
+        return
+
+    # GitHub takes reviewers off the requested list once they've submitted a
+    # review, so without this anyone cc'ed who has reviewed would be requested
+    # (and notified) again on every push
+    reviewed = reviewed_by(github, number)
+    to_add = [login for login in to_add if login.lower() not in reviewed]
+    if len(to_add) == 0:
+        print("Everyone cc'ed has already reviewed or has a review requested")
+        return
 
-    print("Found matches:", matches)
-    reviewers = []
-    for match in matches:
-        if match.startswith("cc "):
-            match = match.replace("cc ", "")
-        users = [x.strip() for x in match.split("@")]
-        reviewers += users
+    teams: List[str] = []
+    if collaborators is not None:
+        to_add, teams, unknown = collaborators.split(to_add)
+        if len(unknown) > 0:
+            print("Skipping cc'ed handles that can't review:", unknown)
+        if len(to_add) == 0 and len(teams) == 0:
+            print("No one cc'ed can review")
+            return
+    print("Adding reviewers:", to_add + teams)
 
-    reviewers = set(x for x in reviewers if x != "")
-    return list(reviewers)
+    request: Dict[str, Any] = {"reviewers": to_add}
+    if len(teams) > 0:
+        request["team_reviewers"] = teams
+    github.post(f"pulls/{number}/requested_reviewers", request)
+
+
+def read_events(f: TextIO, full_name: str) -> Dict[int, Dict[str, Any]]:
+    """
+    The latest version of each PR in a JSONL stream of pull_request webhook
+    payloads (optionally wrapped as {"event": ..., "payload": ...}, the format
+    webhook_server.py --replay sends). Only PRs with at least one event
+    cc_bot.yml would run on (see CC_ACTIONS) that are still open as of their
+    latest event are returned. Events for other repos are skipped.
+    """
+    prs: Dict[int, Dict[str, Any]] = {}
+    wanted: Set[int] = set()
+    events = 0
+    for line in f:
+        if line.strip() == "":
+            continue
+        item = json.loads(line)
+        if "payload" in item:
+            if item.get("event") != "pull_request":
+                continue
+            item = item["payload"]
+        if "pull_request" not in item:
+            continue
+        repo = item.get("repository", {}).get("full_name", full_name)
+        if repo.lower() != full_name.lower():
+            continue
+        events += 1
+        pr = item["pull_request"]
+        if item.get("action") in CC_ACTIONS:
+            wanted.add(pr["number"])
+        old = prs.get(pr["number"])
+        # Replays aren't always in order, so go by when the PR was updated
+        # rather than where the event is in the stream
+        if old is None or pr["updated_at"] >= old["updated_at"]:
+            prs[pr["number"]] = pr
+    # e.g. a PR that was closed after it was opened doesn't need reviewers
+    prs = {
+        number: pr
+        for number, pr in prs.items()
+        if number in wanted and pr.get("state", "open") == "open"
+    }
+    print(f"Read {events} events for {len(prs)} PRs")
+    return prs
 
 
 if __name__ == "__main__":
     help = "Exits with 0 if CI should be skipped, 1 otherwise"
     parser = argparse.ArgumentParser(description=help)
     parser.add_argument("--remote", default="origin", help="ssh remote to parse")
+    parser.add_argument(
+        "--mention-index",
+        help="SQLite file to remember the cc'ed reviewers in each PR body in",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.getenv("GITHUB_CACHE_DIR"),
+        help="directory to keep ETag-validated responses (e.g. the requested "
+        "reviewers and collaborators) in between runs",
+    )
+    parser.add_argument(
+        "--telemetry",
+        default=os.getenv("GITHUB_TELEMETRY"),
+        help="JSON lines file to append a record of every GitHub request to",
+    )
+    parser.add_argument(
+        "--events",
+        metavar="EVENTS_JSONL",
+        help="handle every PR in this stream of pull_request events ('-' for "
+        "stdin) instead of the one in $PR",
+    )
+    parser.add_argument(
+        "--max-writes", type=int, default=4, help="max concurrent reviewer requests"
+    )
+    parser.add_argument(
+        "--collaborators-cache",
+        help="JSON file to keep the repo's collaborators and teams in between runs",
+    )
+    parser.add_argument(
+        "--collaborators-ttl",
+        type=float,
+        default=3600,
+        help="seconds to trust the collaborator list for before fetching it again",
+    )
+    parser.add_argument(
+        "--no-filter",
+        action="store_true",
+        help="request everyone cc'ed without checking they're collaborators",
+    )
     args = parser.parse_args()
 
 
     remote = git(["config", "--get", f"remote.{args.remote}.url"])
     user, repo = parse_remote(remote)
-    github = GitHubRepo(token=os.environ["GITHUB_TOKEN"], user=user, repo=repo)
-    pr = json.loads(os.environ["PR"])
+    cache = None
+    if args.cache_dir is not None:
+        cache = ResponseCache(args.cache_dir)
+    telemetry = Telemetry(args.telemetry)
+    github = GitHubRepo(
+        token=TokenPool.from_env(),
+        user=user,
+        repo=repo,
+        cache=cache,
+        telemetry=telemetry,
+    )
+    writes = WriteScheduler(
+        max_workers=args.max_writes, rate_limits=github.rate_limits
+    )
+    if args.events is None:
+        prs = [json.loads(os.environ["PR"])]
+    elif args.events == "-":
+        prs = list(read_events(sys.stdin, f"{user}/{repo}").values())
+    else:
+        with open(args.events) as f:
+            prs = list(read_events(f, f"{user}/{repo}").values())
     # with open("target.json") as f:
     #     pr = json.load(f)
 
-    number = pr["number"]
-    body = pr["body"]
-    if body is None:
-        body = ""
+    mentions = None
+    if args.mention_index is not None:
+        mentions = MentionIndex(args.mention_index)
 
-    to_add = find_reviewers(body)
-    print("Adding reviewers:", to_add)
+    collaborators = None
+    if not args.no_filter:
+        collaborators = Collaborators(
+            github, args.collaborators_cache, args.collaborators_ttl
+        )
 
-    github.post(f"pulls/{number}/requested_reviewers", {
-        "reviewers": to_add
-    })
+    for pr in prs:
+        writes.submit(add_reviewers, github, pr, mentions, collaborators)
+    failed_writes = writes.shutdown()
+    if mentions is not None:
+        mentions.close()
+    if cache is not None:
+        print(cache.summary())
+    print(telemetry.summary())
+    telemetry.close()
+    if len(failed_writes) > 0:
+        sys.exit(1)
@@ -18,176 +18,245 @@
 
 import os
 import json
+import sys
 import argparse
-import subprocess
-import re
-from urllib import request
 from urllib import error
-from typing import Dict, Tuple, Any
+from typing import Dict, Any, List
 
+from git_utils import (
+    GitHubRepo,
+    Telemetry,
+    TokenPool,
+    WriteScheduler,
+    rate_limit_delay,
+    parse_remote,
+    git,
+)
+from models import CheckContext
 
-def commit_query(repo: str, user: str, sha: str) -> str:
+
+COMMITS_PER_QUERY = 50
+
+READY_LABEL = "ready-for-merge"
+
+PR_FIELDS = """
+            associatedPullRequests(last:1) {
+            nodes {
+                number
+                reviewDecision
+                labels(first:100) {
+                nodes {
+                    name
+                }
+                }
+                commits(last:1) {
+                nodes {
+                    commit {
+                    oid
+                    statusCheckRollup {
+                        state
+                    }
+                    }
+                }
+                }
+            }
+            }
+"""
+
+
+def contexts_query(repo: str, user: str, sha: str, cursor: str = None) -> str:
+    after = ""
+    if cursor is not None:
+        after = f', after:"{cursor}"'
     return f"""
-    {{
+    query CommitContexts {{
+    rateLimit {{ cost remaining }}
     repository(name: "{repo}", owner: "{user}") {{
         object(oid: "{sha}") {{
         ... on Commit {{
-            associatedPullRequests(last:1) {{
-            nodes {{
-                number
-                reviewDecision
-                commits(last:1) {{
+            statusCheckRollup {{
+                contexts(first:100{after}) {{
+                pageInfo {{
+                    hasNextPage
+                    endCursor
+                }}
                 nodes {{
-                    commit {{
-                    statusCheckRollup {{
-                        contexts(last:100) {{
-                        nodes {{
-                            ... on CheckRun {{
-                            conclusion
-                            status
+                    ... on CheckRun {{
+                    conclusion
+                    status
+                    name
+                    checkSuite {{
+                        workflowRun {{
+                        workflow {{
                             name
-                            checkSuite {{
-                                workflowRun {{
-                                workflow {{
-                                    name
-                                }}
-                                }}
-                            }}
-                            }}
-                            ... on StatusContext {{
-                            context
-                            state
-                            }}
                         }}
                         }}
                     }}
                     }}
+                    ... on StatusContext {{
+                    context
+                    state
+                    }}
                 }}
                 }}
             }}
-            }}
         }}
         }}
     }}
     }}"""
 
 
-class GitHubRepo:
-    def __init__(self, user, repo, token):
-        self.token = token
-        self.user = user
-        self.repo = repo
-        self.base = f"https://api.github.com/repos/{user}/{repo}/"
-
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.token}",
-        }
-
-    def graphql(self, query: str) -> Dict[str, Any]:
-        return self._post("https://api.github.com/graphql", {"query": query})
-
-    def _post(self, full_url: str, body: Dict[str, Any]) -> Dict[str, Any]:
-        print("Requesting", full_url)
-        req = request.Request(full_url, headers=self.headers(), method="POST")
-        req.add_header("Content-Type", "application/json; charset=utf-8")
-        data = json.dumps(body)
-        data = data.encode("utf-8")
-        req.add_header("Content-Length", len(data))
-
-        with request.urlopen(req, data) as response:
-            response = json.loads(response.read())
-        return response
-
-    def post(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        return self._post(self.base + url, data)
-
-    def get(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers())
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-    def delete(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers(), method="DELETE")
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-
-def parse_remote(remote: str) -> Tuple[str, str]:
+def fetch_contexts(github: GitHubRepo, sha: str) -> List[Any]:
     """
-    Get a GitHub (user, repo) pair out of a git remote
+    Get every check and status on a commit, following the pagination
     """
-    if remote.startswith("https://"):
-        # Parse HTTP remote
-        parts = remote.split("/")
-        if len(parts) < 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return parts[-2], parts[-1].replace(".git", "")
-    else:
-        # Parse SSH remote
-        m = re.search(r":(.*)/(.*)\.git", remote)
-        if m is None or len(m.groups()) != 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return m.groups()
+    statuses = []
+    cursor = None
+    while True:
+        r = github.graphql(contexts_query(github.repo, github.user, sha, cursor))
+        contexts = r["data"]["repository"]["object"]["statusCheckRollup"]["contexts"]
+        statuses += contexts["nodes"]
+        if not contexts["pageInfo"]["hasNextPage"]:
+            return statuses
+        cursor = contexts["pageInfo"]["endCursor"]
+
+
+def commits_query(repo: str, user: str, shas: List[str]) -> str:
+    """
+    Look up the PR for every commit in 'shas' in one query, with each commit
+    aliased as c0, c1, ...
+    """
+    objects = "\n".join(
+        f'c{i}: object(oid: "{sha}") {{ ... on Commit {{ {PR_FIELDS} }} }}'
+        for i, sha in enumerate(shas)
+    )
+    return f"""
+    query CommitPRs {{
+    rateLimit {{ cost remaining }}
+    repository(name: "{repo}", owner: "{user}") {{
+        {objects}
+    }}
+    }}"""
 
 
-def git(command):
-    proc = subprocess.run(["git"] + command, stdout=subprocess.PIPE, check=True)
-    return proc.stdout.decode().strip()
+def prs_for_commits(data: Dict[str, Any], shas: List[str]) -> Dict[int, Any]:
+    """
+    Pull the PRs out of a commits_query response, keyed by number so commits
+    that belong to the same PR only get checked once
+    """
+    repository = data["data"]["repository"]
+    prs = {}
+    for i, sha in enumerate(shas):
+        commit = repository.get(f"c{i}")
+        if commit is None or len(commit["associatedPullRequests"]["nodes"]) == 0:
+            print(f"No PR found for {sha}")
+            continue
+        pr = commit["associatedPullRequests"]["nodes"][0]
+        prs[pr["number"]] = pr
+    return prs
 
 
-def is_pr_ready(data: Any) -> bool:
+def is_pr_ready(data: Any, github: GitHubRepo) -> bool:
     approved = data["reviewDecision"] == "APPROVED"
     print("Is approved?", approved)
+    if not approved:
+        return False
 
-    statuses = data["commits"]["nodes"][0]["commit"]["statusCheckRollup"]["contexts"][
-        "nodes"
-    ]
-    unified_statuses = []
-    for status in statuses:
-        if "context" in status:
-            unified_statuses.append((status["context"], status["state"] == "SUCCESS"))
-            # non-GHA
-        else:
-            # GitHub Actions
-            workflow = status["checkSuite"]["workflowRun"]["workflow"]["name"]
-            name = f"{workflow} / {status['name']}"
-            unified_statuses.append((name, status["conclusion"] == "SUCCESS"))
+    commit = data["commits"]["nodes"][0]["commit"]
+    rollup = commit["statusCheckRollup"]
+    if rollup is None:
+        # Nothing has reported yet (e.g. CI hasn't been queued since a push)
+        print("No statuses on", commit["oid"])
+        return False
+
+    # Anything but SUCCESS means at least one check is failing or pending, so
+    # there's no need to look at them individually
+    print("Rollup state:", rollup["state"])
+    if rollup["state"] != "SUCCESS":
+        return False
+
+    # The rollup counts skipped and neutral checks as passing but they aren't
+    # good enough here, so check each one
+    statuses = [CheckContext(status) for status in fetch_contexts(github, commit["oid"])]
+    unified_statuses = [(status.name, status.passed) for status in statuses]
 
     print("Got statuses:", json.dumps(unified_statuses, indent=2))
-    passed_ci = all(status for name, status in unified_statuses)
-    return approved and passed_ci
+    passed_ci = all(status.passed for status in statuses)
+    return passed_ci
+
+
+def update_label(github: GitHubRepo, number: int, ready: bool) -> None:
+    if ready:
+        github.post(f"issues/{number}/labels", {"labels": [READY_LABEL]})
+    else:
+        try:
+            github.delete(f"issues/{number}/labels/{READY_LABEL}")
+        except error.HTTPError as e:
+            if rate_limit_delay(e) is not None:
+                raise
+            print(e)
+            print("Failed to remove label (it may have been removed since it was checked)")
+
+
+def check_commits(github: GitHubRepo, writes: WriteScheduler, shas: List[str]) -> None:
+    """
+    Queue up the right label change for every PR that one of 'shas' belongs to
+    """
+    prs = {}
+    for i in range(0, len(shas), COMMITS_PER_QUERY):
+        chunk = shas[i : i + COMMITS_PER_QUERY]
+        data = github.graphql(commits_query(github.repo, github.user, chunk))
+        prs.update(prs_for_commits(data, chunk))
+
+    for number, pr in prs.items():
+        print(f"Checking PR #{number}")
+        ready = is_pr_ready(pr, github)
+        if ready:
+            print("PR passed CI and is approved, labelling...")
+        else:
+            print("PR is not ready for merge")
+
+        labels = set(label["name"] for label in pr["labels"]["nodes"])
+        if ready == (READY_LABEL in labels):
+            print("Label is already up to date")
+            continue
+        writes.submit(update_label, github, number, ready)
 
 
 if __name__ == "__main__":
     help = "Exits with 0 if CI should be skipped, 1 otherwise"
     parser = argparse.ArgumentParser(description=help)
-    parser.add_argument("--sha", required=True)
+    parser.add_argument("--sha", nargs="*", default=[], help="commits to check")
+    parser.add_argument(
+        "--stdin", action="store_true", help="also read commits to check from stdin"
+    )
     parser.add_argument("--remote", default="origin", help="ssh remote to parse")
+    parser.add_argument(
+        "--telemetry",
+        default=os.getenv("GITHUB_TELEMETRY"),
+        help="JSON lines file to append a record of every GitHub request to",
+    )
     args = parser.parse_args()
 
+    shas = list(args.sha)
+    if args.stdin:
+        shas += sys.stdin.read().split()
+    # Keep the order but skip any repeats
+    shas = list(dict.fromkeys(shas))
+    if len(shas) == 0:
+        parser.error("no commits given, use --sha and/or --stdin")
+
     remote = git(["config", "--get", f"remote.{args.remote}.url"])
     user, repo = parse_remote(remote)
-    github = GitHubRepo(token=os.environ["GITHUB_TOKEN"], user=user, repo=repo)
-
-    data = github.graphql(
-        commit_query(repo, user, args.sha)
+    telemetry = Telemetry(args.telemetry)
+    github = GitHubRepo(
+        token=TokenPool.from_env(), user=user, repo=repo, telemetry=telemetry
     )
-    pr = data["data"]["repository"]["object"]["associatedPullRequests"]["nodes"][0]
+    writes = WriteScheduler(rate_limits=github.rate_limits)
 
-    if is_pr_ready(pr):
-        print("PR passed CI and is approved, labelling...")
-        github.post(f"issues/{pr['number']}/labels", {"labels": ["ready-for-merge"]})
-    else:
-        print("PR is not ready for merge")
-        try:
-            github.delete(f"issues/{pr['number']}/labels/ready-for-merge")
-        except error.HTTPError as e:
-            print(e)
-            print("Failed to remove label (it may not have been there at all)")
+    check_commits(github, writes, shas)
+    failed_writes = writes.shutdown()
+    print(telemetry.summary())
+    telemetry.close()
+    if len(failed_writes) > 0:
+        sys.exit(1)
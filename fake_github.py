@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+A local stand-in for the parts of the GitHub REST and GraphQL APIs the bots
+use, for load testing them without a network. Run it, then point the bots at
+it with GITHUB_API_URL, e.g.
+
+    python fake_github.py --prs 10000 --latency-ms 50 --error-rate 0.01 &
+    GITHUB_API_URL=http://127.0.0.1:8081 GITHUB_TOKEN=x python ping_reviewers.py
+"""
+
+import re
+import gzip
+import hashlib
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+import http.server
+from urllib import parse
+from typing import Dict, Tuple, Any, List, Optional
+
+from bench_reviewers import make_pr
+
+
+def now() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def sha_for(number: int) -> str:
+    return f"{number:040x}"
+
+
+class FakeRepo:
+    """
+    Open PRs with generated (but deterministic) reviews and comments. Only the
+    index fields are kept in memory, details are regenerated on each request
+    so large repos stay cheap.
+    """
+
+    def __init__(
+        self, prs: int, reviews: int, comments: int, body_lines: int, seed: int
+    ):
+        self.reviews = reviews
+        self.comments = comments
+        self.body_lines = body_lines
+        self.seed = seed
+        self.lock = threading.Lock()
+        rng = random.Random(seed)
+        self.index: Dict[int, Dict[str, Any]] = {}
+        for number in range(1, prs + 1):
+            updated = datetime.datetime(2021, 1, 1) + datetime.timedelta(
+                seconds=rng.randrange(365 * 24 * 3600)
+            )
+            self.index[number] = {
+                "number": number,
+                "isDraft": rng.random() < 0.1,
+                "publishedAt": "2021-01-01T00:00:00Z",
+                "updatedAt": updated.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        self.new_comments: Dict[int, List[Dict[str, Any]]] = {}
+        self.labels: Dict[int, List[str]] = {}
+        self.requested_reviewers: Dict[int, List[str]] = {}
+        # Only some of the users cc'ed in generated PRs can review
+        self.collaborators = ["author"] + [f"user-{i}" for i in range(250)]
+        self.teams = ["core", "docs"]
+
+    def by_updated(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return sorted(
+                self.index.values(), key=lambda pr: pr["updatedAt"], reverse=True
+            )
+
+    def detail(self, number: int) -> Optional[Dict[str, Any]]:
+        if number not in self.index:
+            return None
+        rng = random.Random(self.seed * 1000003 + number)
+        pr = make_pr(rng, number, self.reviews, self.comments, self.body_lines)
+        with self.lock:
+            pr.update(self.index[number])
+            pr["state"] = "OPEN"
+            pr["comments"]["nodes"] += self.new_comments.get(number, [])
+        return pr
+
+    def add_comment(self, number: int, body: str) -> Dict[str, Any]:
+        timestamp = now()
+        with self.lock:
+            comments = self.new_comments.setdefault(number, [])
+            comments.append(
+                {
+                    "id": f"NEW_{number}_{len(comments)}",
+                    "authorAssociation": "NONE",
+                    "bodyText": body,
+                    "updatedAt": timestamp,
+                    "author": {"login": "bot"},
+                }
+            )
+            self.index[number]["updatedAt"] = timestamp
+        return {"id": len(comments), "body": body, "updated_at": timestamp}
+
+
+class Faults:
+    def __init__(
+        self,
+        latency: float,
+        error_rate: float,
+        rate_limit_rate: float,
+        max_batch: int = 0,
+        limit: int = 5000,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_batch = max_batch
+        self.rng = random.Random()
+        self.limit = limit
+        # Each token gets its own budget for each resource, like GitHub
+        self.remaining: Dict[Tuple[str, str], int] = {}
+        self.lock = threading.Lock()
+
+    def pick(self) -> Optional[Tuple[int, Dict[str, str], Dict[str, Any]]]:
+        """
+        Decide whether to fail this request, returning the (status, headers,
+        body) to respond with if so
+        """
+        if self.latency > 0:
+            time.sleep(self.rng.expovariate(1 / self.latency))
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            return 502, {}, {"message": "Server Error"}
+        if roll < self.error_rate + self.rate_limit_rate:
+            return (
+                403,
+                {"Retry-After": "1"},
+                {"message": "You have exceeded a secondary rate limit."},
+            )
+        return None
+
+    def rate_limit_headers(
+        self, token: str, resource: str
+    ) -> Tuple[bool, Dict[str, str]]:
+        """
+        Charge a request to 'token', returning whether it had any budget left
+        and the headers describing what's left now
+        """
+        with self.lock:
+            remaining = self.remaining.get((token, resource), self.limit)
+            allowed = remaining > 0
+            remaining = max(0, remaining - 1)
+            self.remaining[(token, resource)] = remaining
+        return allowed, {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+            "X-RateLimit-Resource": resource,
+        }
+
+
+def graphql(repo: FakeRepo, query: str, remaining: int) -> Dict[str, Any]:
+    """
+    Answer the handful of query shapes the bots send. This matches on the
+    query text rather than parsing it, so new queries need a case here.
+    """
+    data: Dict[str, Any] = {}
+    # GitHub charges roughly one point per 100 nodes requested, approximated
+    # here as one per top level field
+    cost = 1
+
+    m = re.search(r"pullRequests\(([^)]*)\)", query)
+    if m is not None:
+        args = m.group(1)
+        first = int(re.search(r"first:\s*(\d+)", args).group(1))
+        after = re.search(r'after:\s*"(\d+)"', args)
+        start = int(after.group(1)) if after is not None else 0
+        prs = repo.by_updated()
+        nodes = prs[start : start + first]
+        data["pullRequests"] = {
+            "pageInfo": {
+                "hasNextPage": start + first < len(prs),
+                "endCursor": str(start + first),
+            },
+            "nodes": nodes,
+        }
+
+    for alias, number in re.findall(r"(\w+):\s*pullRequest\(number:\s*(\d+)\)", query):
+        data[alias] = repo.detail(int(number))
+        cost += 1
+
+    for alias, sha in re.findall(r'(\w+):\s*object\(oid:\s*"(\w+)"\)', query):
+        number = int(sha, 16)
+        if number not in repo.index:
+            data[alias] = None
+            continue
+        data[alias] = {
+            "associatedPullRequests": {
+                "nodes": [
+                    {
+                        "number": number,
+                        "reviewDecision": "APPROVED" if number % 3 == 0 else None,
+                        "labels": {
+                            "nodes": [
+                                {"name": label}
+                                for label in repo.labels.get(number, [])
+                            ]
+                        },
+                        "commits": {
+                            "nodes": [
+                                {
+                                    "commit": {
+                                        "oid": sha,
+                                        "statusCheckRollup": {
+                                            "state": "SUCCESS" if number % 2 == 0 else "FAILURE"
+                                        },
+                                    }
+                                }
+                            ]
+                        },
+                    }
+                ]
+            }
+        }
+
+    m = re.search(r'[{\s]object\(oid:\s*"(\w+)"\)', query)
+    if m is not None and "contexts(" in query:
+        after = re.search(r'contexts\([^)]*after:\s*"(\d+)"', query)
+        start = int(after.group(1)) if after is not None else 0
+        total = 150
+        end = min(total, start + 100)
+        nodes = [{"context": f"ci/{i}", "state": "SUCCESS"} for i in range(start, end)]
+        data["object"] = {
+            "statusCheckRollup": {
+                "contexts": {
+                    "pageInfo": {"hasNextPage": end < total, "endCursor": str(end)},
+                    "nodes": nodes,
+                }
+            }
+        }
+
+    result: Dict[str, Any] = {"repository": data}
+    if "rateLimit" in query:
+        result["rateLimit"] = {"cost": cost, "remaining": remaining}
+    return {"data": result}
+
+
+def make_handler(repo: FakeRepo, faults: Faults):
+    class FakeGitHubHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(
+            self, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+        ) -> None:
+            content = json.dumps(body).encode()
+            etag = None
+            if self.command == "GET" and status == 200:
+                etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    status, content = 304, b""
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if etag is not None:
+                self.send_header("ETag", etag)
+            # Like GitHub, only bother compressing bodies of a useful size
+            accept = self.headers.get("Accept-Encoding", "")
+            if "gzip" in accept and len(content) > 1024:
+                content = gzip.compress(content)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def _body(self) -> Any:
+            length = int(self.headers.get("Content-Length", 0))
+            if length == 0:
+                return None
+            return json.loads(self.rfile.read(length))
+
+        def _handle(self, method: str) -> None:
+            body = self._body()
+            resource = "graphql" if self.path == "/graphql" else "core"
+            fault = faults.pick()
+            if fault is not None:
+                status, headers, message = fault
+                self._reply(status, message, headers)
+                return
+
+            if self.path == "/graphql" and faults.max_batch > 0:
+                batch = len(re.findall(r"pullRequest\(number:", body["query"]))
+                if batch > faults.max_batch:
+                    # What GitHub does when a query runs for too long
+                    self._reply(502, {"message": "Server Error"})
+                    return
+
+            token = self.headers.get("Authorization", "")
+            allowed, headers = faults.rate_limit_headers(token, resource)
+            if not allowed:
+                message = {"message": "API rate limit exceeded"}
+                self._reply(403, message, headers)
+                return
+            if self.path == "/graphql":
+                remaining = int(headers["X-RateLimit-Remaining"])
+                self._reply(200, graphql(repo, body["query"], remaining), headers)
+                return
+
+            path, _, query = self.path.partition("?")
+            status, response = self.rest(method, path, parse.parse_qs(query), body)
+            self._reply(status, response, headers)
+
+        def rest(
+            self, method: str, path: str, query: Dict[str, List[str]], body: Any
+        ) -> Tuple[int, Any]:
+            m = re.match(r"/repos/[^/]+/[^/]+/(collaborators|teams)$", path)
+            if m is not None and method == "GET":
+                if m.group(1) == "collaborators":
+                    items = [{"login": login} for login in repo.collaborators]
+                else:
+                    items = [{"slug": slug} for slug in repo.teams]
+                per_page = int(query.get("per_page", ["30"])[0])
+                page = int(query.get("page", ["1"])[0])
+                return 200, items[(page - 1) * per_page : page * per_page]
+
+            m = re.match(r"/repos/[^/]+/[^/]+/(issues|pulls)/(\d+)/(.*)", path)
+            if m is None:
+                return 404, {"message": "Not Found"}
+            _, number, rest = m.groups()
+            number = int(number)
+            if number not in repo.index:
+                return 404, {"message": "Not Found"}
+
+            with repo.lock:
+                labels = repo.labels.setdefault(number, [])
+                reviewers = repo.requested_reviewers.setdefault(number, [])
+
+                if rest == "labels" and method == "GET":
+                    return 200, [{"name": label} for label in labels]
+                if rest == "labels" and method == "POST":
+                    labels += [x for x in body["labels"] if x not in labels]
+                    return 200, [{"name": label} for label in labels]
+                if rest.startswith("labels/") and method == "DELETE":
+                    name = rest[len("labels/") :]
+                    if name not in labels:
+                        return 404, {"message": "Label does not exist"}
+                    labels.remove(name)
+                    return 200, [{"name": label} for label in labels]
+                if rest == "reviews" and method == "GET":
+                    # Every PR has been reviewed by user-1, which takes it off
+                    # the requested reviewers
+                    return 200, [{"user": {"login": "user-1"}, "state": "COMMENTED"}]
+                if rest == "requested_reviewers" and method == "GET":
+                    users = [{"login": x} for x in reviewers if x not in repo.teams]
+                    teams = [{"slug": x} for x in reviewers if x in repo.teams]
+                    return 200, {"users": users, "teams": teams}
+                if rest == "requested_reviewers" and method == "POST":
+                    users = body.get("reviewers", [])
+                    teams = body.get("team_reviewers", [])
+                    if "author" in users:
+                        message = "Review cannot be requested from pull request author."
+                        return 422, {"message": message}
+                    if any(x not in repo.collaborators for x in users) or any(
+                        x not in repo.teams for x in teams
+                    ):
+                        # GitHub rejects the whole request
+                        message = (
+                            "Reviews may only be requested from collaborators. "
+                            "One or more of the users or teams you specified "
+                            "is not a collaborator of the o/r repository."
+                        )
+                        return 422, {"message": message}
+                    reviewers += [x for x in users if x not in reviewers]
+                    reviewers += [x for x in teams if x not in reviewers]
+                    return 201, {"number": number}
+
+            if rest == "comments" and method == "POST":
+                return 201, repo.add_comment(number, body["body"])
+
+            return 404, {"message": "Not Found"}
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+    return FakeGitHubHandler
+
+
+if __name__ == "__main__":
+    help = "Serve a fake GitHub API for load testing the bots"
+    parser = argparse.ArgumentParser(description=help)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--prs", type=int, default=1000, help="open PRs to serve")
+    parser.add_argument("--reviews", type=int, default=2, help="reviews per PR")
+    parser.add_argument("--comments", type=int, default=5, help="comments per review")
+    parser.add_argument("--body-lines", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="mean added latency per request"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of requests that 502"
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0,
+        help="fraction of requests that hit a secondary rate limit",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=0,
+        help="time out GraphQL queries for more than this many PRs (0 for no limit)",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=5000,
+        help="requests each token can make per resource before it's cut off",
+    )
+    args = parser.parse_args()
+
+    repo = FakeRepo(args.prs, args.reviews, args.comments, args.body_lines, args.seed)
+    faults = Faults(
+        args.latency_ms / 1000,
+        args.error_rate,
+        args.rate_limit_rate,
+        args.max_batch,
+        args.rate_limit,
+    )
+    server = http.server.ThreadingHTTPServer(
+        (args.host, args.port), make_handler(repo, faults)
+    )
+    print(f"Serving {args.prs} PRs on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
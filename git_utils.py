@@ -0,0 +1,1504 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import io
+import os
+import gzip
+import atexit
+import codecs
+import json
+import math
+import random
+import re
+import time
+import zlib
+import hashlib
+import tempfile
+import queue
+import threading
+import contextlib
+import subprocess
+import http.client
+from concurrent import futures
+from urllib import error
+from urllib import parse
+from typing import Dict, Tuple, Any, Optional, Iterator, Union, Callable, List
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# GitHub Actions sets this (e.g. for GitHub Enterprise), and it can also be
+# pointed at a local stand-in such as fake_github.py
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+# Where the GraphQL API is, which on GitHub Enterprise Server isn't under
+# API_URL (https://HOST/api/graphql rather than https://HOST/api/v3/graphql).
+# Actions sets this too.
+GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{API_URL}/graphql")
+
+# Seconds to give a GraphQL query before sending a duplicate of it and taking
+# whichever answers first. Off unless set since duplicates cost rate limit.
+HEDGE_AFTER = os.getenv("GITHUB_HEDGE_AFTER")
+
+# Reads (GETs and GraphQL queries) that fail in a way that's likely temporary
+# are retried after a random delay of up to RETRY_BASE_DELAY * 2^attempt
+# seconds, capped at RETRY_MAX_DELAY
+READ_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host for 'cooldown' seconds once 'threshold'
+    in a row have failed (couldn't connect, timed out or got a 5xx), so a
+    degraded GitHub isn't hammered with requests that are likely to fail
+    anyway. Once the cooldown is up requests are let through again, and the
+    next failure trips the breaker straight away.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+
+    def remaining(self) -> float:
+        """
+        Seconds until requests are allowed again (0 if they are now)
+        """
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def check(self) -> None:
+        remaining = self.remaining()
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"too many failed requests, paused for another {remaining:.0f}s"
+            )
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= self.threshold:
+                print(
+                    f"{self._failures} requests in a row failed, pausing "
+                    f"requests for {self.cooldown:.0f}s"
+                )
+                self._open_until = time.monotonic() + self.cooldown
+
+
+class ConnectionPool:
+    """
+    A bounded pool of keep-alive connections to a single host. Connections are
+    handed out to one thread at a time and returned once the response has been
+    fully read, so every request after the first skips the TCP / TLS handshake.
+    Connections give up on connecting after 'connect_timeout' seconds; once a
+    request is sent the caller switches to 'read_timeout'. The pool's breaker
+    is shared by everything talking to the host.
+    """
+
+    def __init__(
+        self,
+        url: str = API_URL,
+        size: int = 8,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+    ):
+        parts = parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = CircuitBreaker()
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout
+            )
+        return http.client.HTTPConnection(
+            self.host, self.port, timeout=self.connect_timeout
+        )
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[Tuple[http.client.HTTPConnection, bool]]:
+        """
+        Check out a connection, yielding it along with whether it has been used
+        before (in which case the server may have closed it while it was idle)
+        """
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._connect()
+                reused = False
+
+            try:
+                yield conn, reused
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_default_pools: Dict[str, ConnectionPool] = {}
+_default_pools_lock = threading.Lock()
+
+
+def default_pool(url: str = API_URL) -> ConnectionPool:
+    """
+    The process-wide pool for 'url' used by any GitHubRepo that isn't given one
+    """
+    with _default_pools_lock:
+        if url not in _default_pools:
+            _default_pools[url] = ConnectionPool(url)
+        return _default_pools[url]
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+ACCEPT_ENCODING = "gzip, br" if brotli is not None else "gzip"
+
+
+class _Body:
+    """
+    Reads a response body while undoing its Content-Encoding, keeping count of
+    the bytes that came over the wire and the bytes they decoded to
+    """
+
+    def __init__(
+        self, response: http.client.HTTPResponse, started: float, retries: int
+    ):
+        self.response = response
+        self.started = started
+        self.retries = retries
+        # Time spent waiting on the server: until the response arrived, then
+        # inside each read of the body. Whatever the caller does between
+        # reads (e.g. decoding a streamed page) isn't counted.
+        self.network = time.monotonic() - started
+        # How long a replayed response originally took
+        self.elapsed: Optional[float] = None
+        self.encoding = response.headers.get("Content-Encoding", "identity")
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        # Set to a list to keep a copy of the decoded body in
+        self.capture: Optional[List[bytes]] = None
+        if self.encoding == "gzip":
+            self._decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+        elif self.encoding == "br" and brotli is not None:
+            self._decompress = brotli.Decompressor().process
+        elif self.encoding == "identity":
+            self._decompress = bytes
+        else:
+            raise RuntimeError(f"Unsupported Content-Encoding '{self.encoding}'")
+
+    def chunks(self, size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        while True:
+            read_started = time.monotonic()
+            data = self.response.read1(size)
+            self.network += time.monotonic() - read_started
+            if len(data) == 0:
+                # read1 doesn't mark the response as finished once its length
+                # runs out, but read does, which frees up the connection
+                self.response.read()
+                return
+            self.wire_bytes += len(data)
+            data = self._decompress(data)
+            self.decoded_bytes += len(data)
+            if self.capture is not None:
+                self.capture.append(data)
+            if len(data) > 0:
+                yield data
+
+    def read(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def latency(self) -> float:
+        """
+        Seconds spent on the network for this response (see 'network')
+        """
+        if self.elapsed is not None:
+            return self.elapsed
+        return self.network
+
+    def total(self) -> float:
+        """
+        Seconds from sending the request until now, including the time the
+        caller took to consume the body
+        """
+        return time.monotonic() - self.started
+
+    def summary(self) -> str:
+        if self.encoding == "identity":
+            return f"{self.wire_bytes} bytes"
+        ratio = self.decoded_bytes / max(1, self.wire_bytes)
+        return (
+            f"{self.wire_bytes} bytes {self.encoding} -> {self.decoded_bytes} "
+            f"decoded ({ratio:.1f}x)"
+        )
+
+
+class _ReplayedResponse:
+    """
+    Stands in for an http.client.HTTPResponse with one read from a Cassette
+    """
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.status: int = entry["status"]
+        self.reason: str = entry["reason"]
+        self.elapsed: float = entry["elapsed"]
+        self.headers = http.client.HTTPMessage()
+        for name, value in entry["headers"]:
+            self.headers[name] = value
+        self._body = io.BytesIO(entry["body"].encode("utf-8"))
+
+    def read1(self, size: int = -1) -> bytes:
+        return self._body.read1(size)
+
+    def read(self) -> bytes:
+        return self._body.read()
+
+
+# Transfer details that don't apply once the body has been decoded
+_UNRECORDED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class Cassette:
+    """
+    A gzipped JSON lines file of request / response pairs. In "record" mode
+    every response a GitHubRepo gets is written to it, and in "replay" mode
+    requests are answered from it instead of the network, so a run can be
+    repeated offline against exactly the same data. Requests are matched on
+    their method, URL and body, and identical requests get the recorded
+    responses in order. Record without a ResponseCache, or the cassette will
+    be full of 304s.
+
+    The time recording started is kept too. Anything that compares timestamps
+    against the current time should use now() so a replay makes the same
+    decisions (and so the same requests) as the recorded run.
+    """
+
+    def __init__(self, path: str, mode: str = "replay"):
+        if mode not in ("record", "replay"):
+            raise RuntimeError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._responses: Dict[str, List[Dict[str, Any]]] = {}
+        self._file = None
+        self.started_at: Optional[float] = None
+        if mode == "record":
+            self.started_at = time.time()
+            self._file = gzip.open(path, "wt")
+            self._file.write(json.dumps({"started_at": self.started_at}) + "\n")
+        else:
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if "started_at" in entry:
+                        self.started_at = entry["started_at"]
+                        continue
+                    key = ResponseCache.key(
+                        entry["method"], entry["url"], self._encode(entry["request"])
+                    )
+                    self._responses.setdefault(key, []).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def now(self) -> float:
+        """
+        When recording started, whether recording or replaying (or the real
+        time for a cassette recorded before this was kept)
+        """
+        if self.started_at is None:
+            return time.time()
+        return self.started_at
+
+    @staticmethod
+    def _encode(request: Optional[str]) -> Optional[bytes]:
+        return None if request is None else request.encode("utf-8")
+
+    def record(
+        self, method: str, url: str, data: Optional[bytes], reader: "_Body"
+    ) -> None:
+        response = reader.response
+        entry = {
+            "method": method,
+            "url": url,
+            "request": None if data is None else data.decode("utf-8"),
+            "status": response.status,
+            "reason": response.reason,
+            "headers": [
+                [name, value]
+                for name, value in response.headers.items()
+                if name.lower() not in _UNRECORDED_HEADERS
+            ],
+            "body": b"".join(reader.capture or []).decode("utf-8"),
+            "elapsed": round(reader.latency(), 3),
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+
+    def replay(
+        self, method: str, url: str, data: Optional[bytes]
+    ) -> _ReplayedResponse:
+        key = ResponseCache.key(method, url, data)
+        with self._lock:
+            entries = self._responses.get(key)
+            if entries is None:
+                raise RuntimeError(f"{method} {url} isn't in cassette {self.path}")
+            # Anything asked for more times than it was recorded gets the last
+            # response again
+            entry = entries.pop(0) if len(entries) > 1 else entries[0]
+        return _ReplayedResponse(entry)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_default_cassette: Optional[Cassette] = None
+_default_cassette_lock = threading.Lock()
+
+
+def default_cassette() -> Optional[Cassette]:
+    """
+    The cassette set up by GITHUB_CASSETTE (a path) and GITHUB_CASSETTE_MODE
+    ("record" or "replay", the default) if there is one, shared by every
+    GitHubRepo that isn't given one
+    """
+    global _default_cassette
+    path = os.getenv("GITHUB_CASSETTE")
+    if path is None:
+        return None
+    with _default_cassette_lock:
+        if _default_cassette is None:
+            _default_cassette = Cassette(
+                path, os.getenv("GITHUB_CASSETTE_MODE", "replay")
+            )
+            atexit.register(_default_cassette.close)
+        return _default_cassette
+
+
+_JSON_NUMBER_START = "-0123456789"
+_JSON_DELIMITERS = ",]} \t\r\n"
+
+
+class _JSONStream:
+    """
+    Decodes JSON values one at a time off the front of a stream of byte
+    chunks, pulling more chunks in only as needed
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _more(self) -> None:
+        if self.eof:
+            raise ValueError("Unexpected end of JSON stream")
+        # Drop what has already been consumed so the buffer only ever holds
+        # about one value
+        self.buf = self.buf[self.pos :]
+        self.pos = 0
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.buf += self.text_decoder.decode(b"", final=True)
+        else:
+            self.buf += self.text_decoder.decode(chunk)
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._more()
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at '{self.buf[self.pos:self.pos + 20]}'")
+        self.pos += 1
+
+    def _fill(self, target: int) -> None:
+        """
+        Read chunks until at least 'target' characters are buffered past
+        'pos' (or the stream ends), joining them onto the buffer once
+        """
+        parts = [self.buf[self.pos :]]
+        buffered = len(parts[0])
+        while not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                parts.append(self.text_decoder.decode(b"", final=True))
+            else:
+                parts.append(self.text_decoder.decode(chunk))
+                buffered += len(parts[-1])
+                if buffered >= target:
+                    break
+        self.buf = "".join(parts)
+        self.pos = 0
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the end of the buffer (e.g. "1." of
+                # "1.5") decodes as a shorter one, so it only counts as
+                # complete once something that can't be part of it follows
+                if (
+                    self.eof
+                    or self.buf[self.pos] not in _JSON_NUMBER_START
+                    or (end < len(self.buf) and self.buf[end] in _JSON_DELIMITERS)
+                ):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Buffer at least twice as much before trying again, so decoding a
+            # value that spans many chunks costs a small multiple of decoding
+            # it once rather than growing with the square of its size
+            self._fill(2 * (len(self.buf) - self.pos))
+
+    def items(self) -> Iterator[Any]:
+        self.expect("[")
+        while self.peek() != "]":
+            if self.peek() == ",":
+                self.pos += 1
+            yield self.value()
+        self.pos += 1
+
+    def members(self) -> Iterator[Tuple[str, Any]]:
+        self.expect("{")
+        while self.peek() != "}":
+            if self.peek() == ",":
+                self.pos += 1
+            key = self.value()
+            self.expect(":")
+            yield key, self.value()
+        self.pos += 1
+
+
+def stream_json(
+    chunks: Iterator[bytes], path: List[str], envelope: Dict[str, Any]
+) -> Iterator[Any]:
+    """
+    Incrementally decode the JSON document in 'chunks', yielding the items of
+    the array (or the (key, value) members of the object) found at 'path'. All
+    other values are decoded whole into 'envelope', where the streamed
+    container is left empty.
+    """
+    stream = _JSONStream(chunks)
+
+    def walk(obj: Dict[str, Any], depth: int) -> Iterator[Any]:
+        stream.expect("{")
+        while stream.peek() != "}":
+            if stream.peek() == ",":
+                stream.pos += 1
+            key = stream.value()
+            stream.expect(":")
+            if key != path[depth] or stream.peek() not in "[{":
+                obj[key] = stream.value()
+            elif depth < len(path) - 1:
+                obj[key] = {}
+                yield from walk(obj[key], depth + 1)
+            elif stream.peek() == "[":
+                obj[key] = []
+                yield from stream.items()
+            else:
+                obj[key] = {}
+                yield from stream.members()
+        stream.pos += 1
+
+    yield from walk(envelope, 0)
+
+
+class ResponseCache:
+    """
+    On-disk store of response bodies along with the ETag / Last-Modified
+    validators GitHub sent for them. Cached entries are revalidated with a
+    conditional request and a 304 (which doesn't count against the REST rate
+    limit) is answered from disk. Only REST GETs go through it, GitHub's
+    GraphQL API doesn't support conditional requests.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(method: str, url: str, body: Optional[bytes] = None) -> str:
+        h = hashlib.sha256(f"{method} {url}\n".encode())
+        if body is not None:
+            h.update(body)
+        return h.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, headers: Any, content: bytes) -> None:
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            # Nothing to revalidate against
+            return
+
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": content.decode("utf-8"),
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._file(key))
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = 0.0 if total == 0 else 100 * self.hits / total
+        return f"cache hits: {self.hits}, misses: {self.misses} ({rate:.1f}% hit rate)"
+
+
+class RateLimits:
+    """
+    The most recent X-RateLimit-* headers GitHub sent for each resource (core,
+    graphql, search, ...) for one token
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining: Dict[str, int] = {}
+        self.reset: Dict[str, float] = {}
+
+    def update(self, headers: Any) -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        resource = headers.get("X-RateLimit-Resource", "core")
+        with self._lock:
+            self.remaining[resource] = int(remaining)
+            self.reset[resource] = float(reset)
+
+    def exhaust(self, resource: str, reset: Optional[str]) -> None:
+        """
+        Record that 'resource' has nothing left until 'reset' (a Unix time, as
+        in X-RateLimit-Reset), or for a second if that's missing or already
+        past by the local clock
+        """
+        until = time.time() + 1
+        if reset is not None:
+            until = max(until, float(reset))
+        with self._lock:
+            self.remaining[resource] = 0
+            self.reset[resource] = until
+
+    def wait_time(self, resource: str = "core", reserve: int = 0) -> float:
+        """
+        Seconds until a request against 'resource' can be made without dipping
+        into the last 'reserve' requests of the budget
+        """
+        with self._lock:
+            if self.remaining.get(resource, reserve + 1) > reserve:
+                return 0.0
+            return max(0.0, self.reset[resource] - time.time())
+
+
+class TokenPool:
+    """
+    One or more tokens (e.g. for several GitHub App installations), each with
+    its own RateLimits. Each request goes out with whichever token has the
+    most left of the budget it draws on, so the tokens' budgets add up.
+    """
+
+    def __init__(
+        self, tokens: List[str], rate_limits: Optional[List[RateLimits]] = None
+    ):
+        if len(tokens) == 0:
+            raise RuntimeError("No GitHub tokens given")
+        if rate_limits is None:
+            rate_limits = [RateLimits() for _ in tokens]
+        self.tokens = list(zip(tokens, rate_limits))
+
+    @classmethod
+    def from_env(cls) -> "TokenPool":
+        """
+        The comma separated tokens in GITHUB_TOKENS if set, otherwise just
+        GITHUB_TOKEN
+        """
+        tokens = os.getenv("GITHUB_TOKENS")
+        if tokens is None:
+            return cls([os.environ["GITHUB_TOKEN"]])
+        return cls([token.strip() for token in tokens.split(",") if token.strip()])
+
+    @staticmethod
+    def _headroom(limits: RateLimits, resource: str) -> float:
+        with limits._lock:
+            if resource not in limits.remaining:
+                # Not used yet, so it has a full budget
+                return math.inf
+            if limits.reset[resource] <= time.time():
+                return math.inf
+            return limits.remaining[resource]
+
+    def pick(self, resource: str = "core") -> Tuple[str, RateLimits]:
+        return max(self.tokens, key=lambda item: self._headroom(item[1], resource))
+
+    def has_headroom(self, resource: str = "core") -> bool:
+        return any(self._headroom(limits, resource) > 0 for _, limits in self.tokens)
+
+    def wait_time(self, resource: str = "core", reserve: int = 0) -> float:
+        """
+        Seconds until any token can make a request against 'resource' without
+        dipping into the last 'reserve' requests of its budget
+        """
+        return min(limits.wait_time(resource, reserve) for _, limits in self.tokens)
+
+
+def operation_name(query: str) -> str:
+    m = re.match(r"\s*(?:query|mutation)\s+(\w+)", query)
+    return "anonymous" if m is None else m.group(1)
+
+
+def is_mutation(query: str) -> bool:
+    return re.match(r"\s*mutation\b", query) is not None
+
+
+def graphql_rate_limit(result: Any) -> Optional[Dict[str, int]]:
+    """
+    The rateLimit { cost remaining } from a GraphQL response, if the query
+    selected it
+    """
+    if not isinstance(result, dict):
+        return None
+    return (result.get("data") or {}).get("rateLimit")
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Telemetry:
+    """
+    A record of every request a GitHubRepo makes (latency on the network and
+    in total, status, bytes, retries, rate limit left and, for GraphQL, the
+    query's cost), written out as JSON lines to 'path' if given and summarized
+    at the end of a run
+    """
+
+    def __init__(self, path: Optional[str] = None, slowest: int = 5):
+        self.slowest = slowest
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None:
+            self._file = open(path, "a")
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(entry)
+            if self._file is not None:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+
+    def summary(self) -> str:
+        with self._lock:
+            records = list(self.records)
+        if len(records) == 0:
+            return "telemetry: no requests made"
+
+        latencies = [r["latency_ms"] for r in records]
+        errors = sum(1 for r in records if r["status"] >= 400)
+        retries = sum(r["retries"] for r in records)
+        wire = sum(r["wire_bytes"] for r in records)
+        decoded = sum(r["decoded_bytes"] for r in records)
+        lines = [
+            f"telemetry: {len(records)} requests, {errors} errors, {retries} retries",
+            f"  latency p50 {_percentile(latencies, 0.5):.0f}ms, "
+            f"p95 {_percentile(latencies, 0.95):.0f}ms",
+            f"  {wire} bytes on the wire, {decoded} decoded",
+        ]
+
+        remaining = [
+            r["rate_limit_remaining"]
+            for r in records
+            if r.get("rate_limit_resource") == "core"
+            and r.get("rate_limit_remaining") is not None
+        ]
+        if len(remaining) > 0:
+            lines.append(f"  REST rate limit remaining: {min(remaining)}")
+
+        queries = [r for r in records if "operation" in r]
+        if len(queries) > 0:
+            costs: Dict[str, List[int]] = {}
+            for r in queries:
+                totals = costs.setdefault(r["operation"], [0, 0])
+                totals[0] += 1
+                totals[1] += r.get("cost", 0)
+            total_cost = sum(cost for _, cost in costs.values())
+            lines.append(f"  GraphQL cost: {total_cost}")
+            for name, (count, cost) in sorted(
+                costs.items(), key=lambda item: item[1][1], reverse=True
+            ):
+                lines.append(f"    {name}: {cost} over {count} queries")
+
+            lines.append("  slowest queries:")
+            for r in sorted(queries, key=lambda r: r["latency_ms"], reverse=True)[
+                : self.slowest
+            ]:
+                lines.append(
+                    f"    {r['latency_ms']:.0f}ms {r['operation']} "
+                    f"(cost {r.get('cost', '?')}, {r['decoded_bytes']} bytes)"
+                )
+
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def rate_limit_delay(e: error.HTTPError) -> Optional[float]:
+    """
+    How long GitHub wants us to wait before retrying a request that failed
+    with 'e', or None if it didn't fail because of a rate limit
+    """
+    if e.code not in (403, 429):
+        return None
+
+    retry_after = e.headers.get("Retry-After")
+    if retry_after is not None:
+        return float(retry_after)
+
+    if e.headers.get("X-RateLimit-Remaining") == "0":
+        return max(0.0, float(e.headers["X-RateLimit-Reset"]) - time.time())
+
+    if b"secondary rate limit" in e.read():
+        # GitHub asks for at least a minute when it doesn't say how long
+        return 60.0
+
+    return None
+
+
+class WriteScheduler:
+    """
+    Runs GitHub writes on a bounded set of worker threads so callers can queue
+    them up and keep going. Writes are spaced out by an interval that grows
+    when GitHub pushes back with a primary or secondary rate limit and decays
+    again as writes succeed, and are retried once the limit has passed.
+
+    Callers that run indefinitely and never wait() should pass
+    keep_futures=False, so each failed write is logged as soon as it fails and
+    finished writes aren't held on to.
+    """
+
+    MIN_INTERVAL = 0.0
+    MAX_INTERVAL = 30.0
+    BACKOFF_STEP = 1.0
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        rate_limits: Optional[Union[RateLimits, TokenPool]] = None,
+        max_retries: int = 5,
+        reserve: int = 50,
+        keep_futures: bool = True,
+    ):
+        self.max_retries = max_retries
+        self.keep_futures = keep_futures
+        self.rate_limits = rate_limits
+        self.reserve = reserve
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="github-write"
+        )
+        self._futures: List[futures.Future] = []
+        self._lock = threading.Lock()
+        self._interval = self.MIN_INTERVAL
+        self._next_start = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> futures.Future:
+        future = self._executor.submit(self._run, fn, args, kwargs)
+        if self.keep_futures:
+            with self._lock:
+                self._futures.append(future)
+        else:
+            future.add_done_callback(self._log_failure)
+        return future
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Like submit, but run 'fn' on the calling thread and return its result
+        """
+        return self._run(fn, args, kwargs)
+
+    @staticmethod
+    def _log_failure(future: futures.Future) -> None:
+        e = future.exception()
+        if e is not None:
+            print("Write failed:", e)
+
+    def _wait_turn(self) -> None:
+        if self.rate_limits is not None:
+            delay = self.rate_limits.wait_time("core", self.reserve)
+            if delay > 0:
+                print(f"Primary rate limit nearly used up, waiting {delay:.0f}s")
+                self._back_off(delay)
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+        time.sleep(start - now)
+
+    def _back_off(self, delay: float) -> None:
+        with self._lock:
+            self._next_start = max(self._next_start, time.monotonic() + delay)
+            self._interval = min(
+                self.MAX_INTERVAL, max(self.BACKOFF_STEP, self._interval * 2)
+            )
+
+    def _run(self, fn: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self._wait_turn()
+            try:
+                result = fn(*args, **kwargs)
+            except error.HTTPError as e:
+                delay = rate_limit_delay(e)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                print(f"Rate limited ({e.code}), retrying in {delay:.0f}s")
+                self._back_off(delay)
+                continue
+
+            with self._lock:
+                self._interval = max(self.MIN_INTERVAL, self._interval * 0.75)
+            return result
+
+    def wait(self) -> List[BaseException]:
+        """
+        Block until every queued write has finished, returning the errors from
+        any that failed
+        """
+        with self._lock:
+            pending, self._futures = self._futures, []
+
+        errors = []
+        for future in futures.as_completed(pending):
+            e = future.exception()
+            if e is not None:
+                print("Write failed:", e)
+                errors.append(e)
+        return errors
+
+    def shutdown(self) -> List[BaseException]:
+        errors = self.wait()
+        self._executor.shutdown()
+        return errors
+
+
+class PageSizer:
+    """
+    Picks how many items to ask for per page (or batch) of a GraphQL query.
+    The size grows while pages come back quickly and cheaply, shrinks when
+    they're slow or expensive, and is halved when GitHub gives up on a page
+    (it answers a query that runs too long with a 502 or 504) so the page
+    can be retried smaller. It never grows back to a size that failed.
+    """
+
+    GROW = 1.5
+    SHRINK = 0.75
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        minimum: int,
+        maximum: int,
+        target_seconds: float = 5.0,
+        max_cost: Optional[int] = None,
+    ):
+        self.name = name
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.max_cost = max_cost
+
+    def _resize(self, size: int, reason: str) -> None:
+        size = max(self.minimum, min(self.maximum, size))
+        if size != self.size:
+            print(f"{self.name} page size {self.size} -> {size} ({reason})")
+            self.size = size
+
+    def record(self, seconds: float, cost: Optional[int] = None) -> None:
+        """
+        Adjust the size after a page took 'seconds' and had a query cost of
+        'cost' (if known)
+        """
+        reason = f"{seconds:.1f}s"
+        if cost is not None:
+            reason += f", cost {cost}"
+
+        if seconds > self.target_seconds or (
+            cost is not None and self.max_cost is not None and cost > self.max_cost
+        ):
+            self._resize(int(self.size * self.SHRINK), reason)
+        elif seconds < self.target_seconds / 2 and (
+            cost is None or self.max_cost is None or cost < self.max_cost / 2
+        ):
+            self._resize(math.ceil(self.size * self.GROW), reason)
+
+    def shrink(self, reason: str) -> bool:
+        """
+        Halve the size after a page failed, returning True if it can be
+        retried at the new size (False if it's already as small as it goes)
+        """
+        if self.size == self.minimum:
+            return False
+        self.maximum = max(self.minimum, self.size - 1)
+        self._resize(self.size // 2, reason)
+        return True
+
+    def failed(self, e: Exception) -> bool:
+        """
+        Like shrink, for when a page raised 'e', but only if it's GitHub timing
+        the query out
+        """
+        if not isinstance(e, error.HTTPError) or e.code not in (502, 504):
+            return False
+        return self.shrink(f"HTTP {e.code}")
+
+
+class GitHubRepo:
+    def __init__(
+        self,
+        user,
+        repo,
+        token: Union[str, TokenPool],
+        pool: Optional[ConnectionPool] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limits: Optional[RateLimits] = None,
+        api_url: Optional[str] = None,
+        graphql_url: Optional[str] = None,
+        telemetry: Optional[Telemetry] = None,
+        hedge_after: Optional[float] = None,
+        cassette: Optional[Cassette] = None,
+    ):
+        self.user = user
+        self.repo = repo
+        self.api_url = api_url if api_url is not None else API_URL
+        if graphql_url is None:
+            graphql_url = GRAPHQL_URL if api_url is None else f"{api_url}/graphql"
+        self.graphql_url = graphql_url
+        self.pool = pool if pool is not None else default_pool(self.api_url)
+        self.cache = cache
+        if isinstance(token, TokenPool):
+            self.tokens = token
+        else:
+            if rate_limits is None:
+                rate_limits = RateLimits()
+            self.tokens = TokenPool([token], [rate_limits])
+        # Anything waiting on the rate limit (e.g. a WriteScheduler) only
+        # needs one token to have some left
+        self.rate_limits = self.tokens
+        self.telemetry = telemetry
+        self.cassette = cassette if cassette is not None else default_cassette()
+        self._last = threading.local()
+        if hedge_after is None and HEDGE_AFTER is not None:
+            hedge_after = float(HEDGE_AFTER)
+        self.hedge_after = hedge_after
+        self._hedges = None
+        if hedge_after is not None:
+            self._hedges = futures.ThreadPoolExecutor(
+                max_workers=8, thread_name_prefix="github-hedge"
+            )
+        self.base = f"{self.api_url}/repos/{user}/{repo}/"
+
+    def headers(self):
+        return {
+            "Accept": "application/vnd.github.v3+json",
+            "User-Agent": "reviewer-bot",
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
+
+    def now(self) -> float:
+        """
+        The current time, as far as decisions about what to request go. With a
+        cassette this is when it was recorded (see Cassette.now).
+        """
+        if self.cassette is not None:
+            return self.cassette.now()
+        return time.time()
+
+    def last_latency(self) -> float:
+        """
+        Seconds the last request made from this thread spent on the network,
+        from sending it to the last of the body being read but leaving out the
+        time spent processing the body between reads
+        """
+        return getattr(self._last, "latency", 0.0)
+
+    def _hedging(self, query: str) -> bool:
+        # A cassette needs exactly one response per request, and writes must
+        # never be sent twice
+        return (
+            self._hedges is not None
+            and self.cassette is None
+            and not is_mutation(query)
+        )
+
+    def graphql(self, query: str) -> Dict[str, Any]:
+        def send() -> Dict[str, Any]:
+            # Not cacheable: GitHub doesn't send validators for GraphQL
+            # responses, so every query would count as a miss
+            return self._request("POST", self.graphql_url, {"query": query})
+
+        if not self._hedging(query):
+            return send()
+
+        # Some queries get stuck behind a slow backend, and a duplicate sent
+        # after a while often comes back before the original does
+        first = self._hedges.submit(send)
+        try:
+            return first.result(timeout=self.hedge_after)
+        except futures.TimeoutError:
+            pass
+        print(f"  No response after {self.hedge_after}s, sending a duplicate")
+        second = self._hedges.submit(send)
+        for attempt in futures.as_completed([first, second]):
+            if attempt.exception() is None:
+                return attempt.result()
+        return first.result()
+
+    def graphql_stream(
+        self, query: str, path: List[str], envelope: Dict[str, Any]
+    ) -> Iterator[Any]:
+        """
+        Like graphql, but yields the contents of the array (items) or object
+        ((key, value) pairs) at 'path' in the response while it is still being
+        downloaded. Everything else in the response is put into 'envelope',
+        which is complete once the iterator is exhausted.
+
+        Hedging (see hedge_after) only covers the wait for the response to
+        start, since a body that has been partly handed out can't be swapped
+        for another.
+        """
+        url = self.graphql_url
+        data, headers = self._prepare({"query": query})
+        opener = self._open_hedged if self._hedging(query) else self._open
+        # GitHub answers a page that takes too long with a 502 or 504, which
+        # is left to the caller since retrying the same page is likely to fail
+        # the same way (see PageSizer)
+        with opener(
+            "POST",
+            url,
+            data,
+            headers,
+            idempotent=not is_mutation(query),
+            retry_statuses=(503,),
+        ) as reader:
+            if reader.response.status >= 400:
+                content = reader.read()
+                self._record("POST", url, reader, query)
+                self._raise(url, reader.response, content)
+            chunks = reader.chunks()
+            yield from stream_json(chunks, path, envelope)
+            # Drain anything after the end of the document so the connection
+            # can be reused
+            for _ in chunks:
+                pass
+        self._record("POST", url, reader, query, envelope)
+
+    def _prepare(self, body: Optional[Dict[str, Any]]) -> Tuple[Optional[bytes], Dict[str, str]]:
+        headers = self.headers()
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+            headers["Content-Length"] = str(len(data))
+        return data, headers
+
+    @contextlib.contextmanager
+    def _open_hedged(
+        self,
+        method: str,
+        full_url: str,
+        data: Optional[bytes],
+        headers: Dict[str, str],
+        idempotent: bool = False,
+        retry_statuses: Tuple[int, ...] = RETRY_STATUSES,
+    ) -> Iterator[_Body]:
+        """
+        Like _open, but if no response has started after hedge_after seconds a
+        duplicate request is sent and whichever starts first is used. The
+        other's body is read and dropped in the background so its connection
+        can go back to the pool.
+        """
+
+        def start() -> Tuple[Any, _Body]:
+            opened = self._open(
+                method, full_url, data, dict(headers), idempotent, retry_statuses
+            )
+            return opened, opened.__enter__()
+
+        def discard(attempt: futures.Future) -> None:
+            if attempt.exception() is not None:
+                return
+            opened, reader = attempt.result()
+            with contextlib.ExitStack() as stack:
+                stack.push(opened)
+                reader.read()
+
+        first = self._hedges.submit(start)
+        attempts = [first]
+        try:
+            first.result(timeout=self.hedge_after)
+        except futures.TimeoutError:
+            print(f"  No response after {self.hedge_after}s, sending a duplicate")
+            attempts.append(self._hedges.submit(start))
+
+        winner = None
+        for attempt in futures.as_completed(attempts):
+            if attempt.exception() is None:
+                winner = attempt
+                break
+        if winner is None:
+            first.result()
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.add_done_callback(discard)
+
+        opened, reader = winner.result()
+        with contextlib.ExitStack() as stack:
+            stack.push(opened)
+            yield reader
+
+    @contextlib.contextmanager
+    def _open(
+        self,
+        method: str,
+        full_url: str,
+        data: Optional[bytes],
+        headers: Dict[str, str],
+        idempotent: bool = False,
+        retry_statuses: Tuple[int, ...] = RETRY_STATUSES,
+    ) -> Iterator[_Body]:
+        """
+        Send a request and yield a reader for the response's body. The
+        connection goes back to the pool once the block exits, so the body
+        must be fully read by then.
+
+        If the request is 'idempotent', failing to get a response or getting
+        one of 'retry_statuses' is retried with a jittered backoff (up to
+        READ_RETRIES times). Nothing is retried once the response has been
+        handed out.
+        """
+        print("Requesting", full_url)
+        started = time.monotonic()
+        parts = parse.urlsplit(full_url)
+        path = parts.path
+        if parts.query:
+            path += "?" + parts.query
+        resource = "graphql" if parts.path.endswith("/graphql") else "core"
+
+        if self.cassette is not None and self.cassette.replaying:
+            response = self.cassette.replay(method, full_url, data)
+            reader = _Body(response, started, retries=0)
+            # Report the time it took when it was recorded, so anything that
+            # adapts to response times (e.g. a PageSizer) behaves the same
+            reader.elapsed = response.elapsed
+            yield reader
+            return
+
+        attempt = 0
+        failures = 0
+        switches = 0
+        handed_out = False
+        while True:
+            attempt += 1
+            token, limits = self.tokens.pick(resource)
+            headers["Authorization"] = f"Bearer {token}"
+            try:
+                self.pool.breaker.check()
+                with self.pool.connection() as (conn, reused):
+                    try:
+                        conn.request(method, path, body=data, headers=headers)
+                        # GitHub can take a while to answer, especially on
+                        # GraphQL, so the (short) connect timeout no longer
+                        # applies once it has the request
+                        conn.sock.settimeout(self.pool.read_timeout)
+                        response = conn.getresponse()
+                    except (http.client.RemoteDisconnected, ConnectionError):
+                        conn.close()
+                        # An idle keep-alive connection may have been dropped
+                        # by the server, in which case try once more on a
+                        # fresh one
+                        if reused and attempt == 1:
+                            continue
+                        raise
+
+                    self.pool.breaker.record(response.status < 500)
+                    limits.update(response.headers)
+                    if (
+                        response.status in (403, 429)
+                        and response.headers.get("X-RateLimit-Remaining") == "0"
+                    ):
+                        # Make sure this token isn't picked again until it
+                        # resets, even if the headers don't say when that is
+                        limits.exhaust(
+                            resource, response.headers.get("X-RateLimit-Reset")
+                        )
+                        if switches < len(self.tokens.tokens) and (
+                            self.tokens.has_headroom(resource)
+                        ):
+                            # Another token has some left. Nothing was done, so
+                            # even writes are safe to send again.
+                            print("  Token out of rate limit, switching to another")
+                            switches += 1
+                            response.read()
+                            continue
+                    if not (
+                        idempotent
+                        and response.status in retry_statuses
+                        and failures < READ_RETRIES
+                    ):
+                        handed_out = True
+                        reader = _Body(response, started, retries=attempt - 1)
+                        if self.cassette is not None:
+                            reader.capture = []
+                        try:
+                            yield reader
+                        except (OSError, http.client.HTTPException) as e:
+                            if isinstance(e, error.HTTPError):
+                                # The body has been read to put in the error
+                                if self.cassette is not None:
+                                    self.cassette.record(method, full_url, data, reader)
+                            else:
+                                self.pool.breaker.record(False)
+                            raise
+                        if self.cassette is not None:
+                            self.cassette.record(method, full_url, data, reader)
+                        return
+
+                    # Read the body so the connection can be reused
+                    response.read()
+                    reason: Union[str, Exception] = f"HTTP {response.status}"
+            except (OSError, http.client.HTTPException) as e:
+                if handed_out:
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    self.pool.breaker.record(False)
+                if not idempotent or failures == READ_RETRIES:
+                    raise
+                reason = e
+
+            delay = random.uniform(
+                0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** failures)
+            )
+            delay = max(delay, self.pool.breaker.remaining())
+            failures += 1
+            print(f"  Failed ({reason}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _record(
+        self,
+        method: str,
+        full_url: str,
+        reader: _Body,
+        query: Optional[str] = None,
+        result: Any = None,
+    ) -> None:
+        """
+        Log and (if enabled) record telemetry for a finished request. 'result'
+        is the decoded response, used to find a GraphQL query's cost.
+        """
+        print("  Received", reader.summary())
+        latency = reader.latency()
+        self._last.latency = latency
+        if self.telemetry is None:
+            return
+
+        headers = reader.response.headers
+        remaining = headers.get("X-RateLimit-Remaining")
+        entry = {
+            "time": time.time(),
+            "method": method,
+            "url": full_url,
+            "status": reader.response.status,
+            "latency_ms": round(1000 * latency, 1),
+            "total_ms": round(1000 * reader.total(), 1),
+            "wire_bytes": reader.wire_bytes,
+            "decoded_bytes": reader.decoded_bytes,
+            "retries": reader.retries,
+            "rate_limit_resource": headers.get("X-RateLimit-Resource"),
+            "rate_limit_remaining": None if remaining is None else int(remaining),
+        }
+        if query is not None:
+            entry["operation"] = operation_name(query)
+            rate_limit = graphql_rate_limit(result)
+            if rate_limit is not None:
+                entry["cost"] = rate_limit["cost"]
+                entry["graphql_remaining"] = rate_limit["remaining"]
+        self.telemetry.record(entry)
+
+    def _raise(
+        self, full_url: str, response: http.client.HTTPResponse, content: bytes
+    ) -> None:
+        raise error.HTTPError(
+            full_url,
+            response.status,
+            response.reason,
+            response.headers,
+            io.BytesIO(content),
+        )
+
+    def _request(
+        self,
+        method: str,
+        full_url: str,
+        body: Optional[Dict[str, Any]] = None,
+        cacheable: bool = False,
+    ) -> Any:
+        data, headers = self._prepare(body)
+        query = None
+        if body is not None and full_url == self.graphql_url:
+            query = body["query"]
+
+        cache_key = None
+        cached = None
+        if cacheable and self.cache is not None:
+            cache_key = ResponseCache.key(method, full_url, data)
+            cached = self.cache.load(cache_key)
+            if cached is not None:
+                if cached["etag"] is not None:
+                    headers["If-None-Match"] = cached["etag"]
+                if cached["last_modified"] is not None:
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+        idempotent = method == "GET" or (query is not None and not is_mutation(query))
+        with self._open(method, full_url, data, headers, idempotent) as reader:
+            content = reader.read()
+        response = reader.response
+
+        if cache_key is not None:
+            if response.status == 304 and cached is not None:
+                self.cache.record(hit=True)
+                self._record(method, full_url, reader, query)
+                return json.loads(cached["body"])
+            self.cache.record(hit=False)
+            if response.status == 200:
+                self.cache.store(cache_key, response.headers, content)
+
+        if response.status >= 400:
+            self._record(method, full_url, reader, query)
+            self._raise(full_url, response, content)
+
+        result = {} if len(content) == 0 else json.loads(content)
+        self._record(method, full_url, reader, query, result)
+        return result
+
+    def _post(self, full_url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        return self._request("POST", full_url, body)
+
+    def post(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self._post(self.base + url, data)
+
+    def get(self, url: str) -> Union[Dict[str, Any], list]:
+        return self._request("GET", self.base + url, cacheable=True)
+
+    def delete(self, url: str) -> Union[Dict[str, Any], list]:
+        return self._request("DELETE", self.base + url)
+
+
+def parse_remote(remote: str) -> Tuple[str, str]:
+    """
+    Get a GitHub (user, repo) pair out of a git remote
+    """
+    if remote.startswith("https://"):
+        # Parse HTTP remote
+        parts = remote.split("/")
+        if len(parts) < 2:
+            raise RuntimeError(f"Unable to parse remote '{remote}'")
+        return parts[-2], parts[-1].replace(".git", "")
+    else:
+        # Parse SSH remote
+        m = re.search(r":(.*)/(.*)\.git", remote)
+        if m is None or len(m.groups()) != 2:
+            raise RuntimeError(f"Unable to parse remote '{remote}'")
+        return m.groups()
+
+
+def git(command):
+    proc = subprocess.run(["git"] + command, stdout=subprocess.PIPE, check=True)
+    return proc.stdout.decode().strip()
@@ -0,0 +1,94 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional
+
+
+def find_reviewers(body: str) -> List[str]:
+    matches = re.findall(r"(cc( @[-A-Za-z0-9]+)+)", body, flags=re.MULTILINE)
+    matches = [full for full, last in matches]
+
+    reviewers = []
+    for match in matches:
+        if match.startswith("cc "):
+            match = match.replace("cc ", "")
+        users = [x.strip() for x in match.split("@")]
+        reviewers += users
+
+    reviewers = set(x for x in reviewers if x != "")
+    return list(reviewers)
+
+
+def body_version(body: Optional[str]) -> str:
+    """
+    A version for a PR body to key MentionIndex on. A PR's updatedAt changes
+    on every push, so it would miss on nearly every event.
+    """
+    return "sha1:" + hashlib.sha1((body or "").encode()).hexdigest()
+
+
+class MentionIndex:
+    """
+    SQLite-backed record of the cc @... mentions found in each comment (or PR
+    body), keyed by its node ID and a version: updatedAt for comments and
+    body_version() for PR bodies. A body is only parsed again if it has been
+    edited since it was last seen.
+    """
+
+    def __init__(self, path: str, commit_every: int = 100):
+        self.path = path
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS mentions "
+            "(id TEXT PRIMARY KEY, updated_at TEXT, reviewers TEXT)"
+        )
+
+    def reviewers(self, id: str, version: str, body: Optional[str]) -> List[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT updated_at, reviewers FROM mentions WHERE id = ?", (id,)
+            ).fetchone()
+            if row is not None and row[0] == version:
+                self.hits += 1
+                return json.loads(row[1])
+
+            self.misses += 1
+            reviewers = find_reviewers(body or "")
+            self._db.execute(
+                "INSERT OR REPLACE INTO mentions VALUES (?, ?, ?)",
+                (id, version, json.dumps(reviewers)),
+            )
+            if self.misses % self.commit_every == 0:
+                self._db.commit()
+            return reviewers
+
+    def summary(self) -> str:
+        return f"mention index: {self.hits} reused, {self.misses} parsed"
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,137 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import time
+import calendar
+from typing import Dict, Any, Iterator, Optional
+
+
+def parse_time(timestamp: str) -> int:
+    """
+    Seconds since the epoch for a GitHub timestamp like 2021-01-01T00:00:00Z.
+    GitHub always uses this exact format so it's sliced rather than going
+    through strptime, which is several times slower.
+    """
+    return calendar.timegm(
+        (
+            int(timestamp[0:4]),
+            int(timestamp[5:7]),
+            int(timestamp[8:10]),
+            int(timestamp[11:13]),
+            int(timestamp[14:16]),
+            int(timestamp[17:19]),
+            0,
+            0,
+            0,
+        )
+    )
+
+
+def format_time(epoch: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+def _login(actor: Optional[Dict[str, Any]]) -> Optional[str]:
+    # Deleted accounts come back as a null author
+    if actor is None:
+        return None
+    return actor["login"]
+
+
+class Comment:
+    __slots__ = ("id", "body", "updated_at", "author")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id: Optional[str] = data.get("id")
+        self.body: str = data["bodyText"]
+        self.updated_at = parse_time(data["updatedAt"])
+        self.author = _login(data.get("author"))
+
+
+class Review:
+    __slots__ = ("author", "_comments")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.author = _login(data["author"])
+        self._comments = data["comments"]["nodes"]
+
+    def comments(self) -> Iterator[Comment]:
+        for comment in self._comments:
+            yield Comment(comment)
+
+
+class PR:
+    """
+    A view over one PR node from a GraphQL response. Scalars are read up front;
+    reviews and comments are wrapped one at a time as they're iterated, so the
+    response's lists are never copied.
+    """
+
+    __slots__ = (
+        "number",
+        "url",
+        "is_draft",
+        "published_at",
+        "updated_at",
+        "_reviews",
+        "_comments",
+    )
+
+    def __init__(self, data: Dict[str, Any]):
+        self.number: int = data["number"]
+        self.url: Optional[str] = data.get("url")
+        self.is_draft: bool = data.get("isDraft", False)
+        self.published_at = parse_time(data["publishedAt"])
+        self.updated_at = None
+        if data.get("updatedAt") is not None:
+            self.updated_at = parse_time(data["updatedAt"])
+        self._reviews = data.get("reviews", {"nodes": []})["nodes"]
+        self._comments = data.get("comments", {"nodes": []})["nodes"]
+
+    def reviews(self) -> Iterator[Review]:
+        for review in self._reviews:
+            yield Review(review)
+
+    def comments(self) -> Iterator[Comment]:
+        """
+        Standalone comments followed by the comments left as part of reviews
+        (GitHub counts these separately)
+        """
+        for comment in self._comments:
+            yield Comment(comment)
+        for review in self.reviews():
+            yield from review.comments()
+
+
+class CheckContext:
+    """
+    One entry from a statusCheckRollup, either a GitHub Actions check run or a
+    plain commit status
+    """
+
+    __slots__ = ("name", "passed")
+
+    def __init__(self, data: Dict[str, Any]):
+        if "context" in data:
+            # non-GHA
+            self.name: str = data["context"]
+            self.passed: bool = data["state"] == "SUCCESS"
+        else:
+            # GitHub Actions
+            workflow = data["checkSuite"]["workflowRun"]["workflow"]["name"]
+            self.name = f"{workflow} / {data['name']}"
+            self.passed = data["conclusion"] == "SUCCESS"
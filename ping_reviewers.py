@@ -18,173 +18,91 @@
 
 import logging
 import os
+import sys
 import json
 import argparse
-import subprocess
-import re
+import time
 import datetime
-from urllib import request
+import functools
+from concurrent import futures
 from urllib import error
-from typing import Dict, Tuple, Any, List
-
-
-def commit_query(repo: str, user: str, sha: str) -> str:
-    return f"""
-    {{
-    repository(name: "{repo}", owner: "{user}") {{
-        object(oid: "{sha}") {{
-        ... on Commit {{
-            associatedPullRequests(last:1) {{
-            nodes {{
-                number
-                reviewDecision
-                commits(last:1) {{
-                nodes {{
-                    commit {{
-                    statusCheckRollup {{
-                        contexts(last:100) {{
-                        nodes {{
-                            ... on CheckRun {{
-                            conclusion
-                            status
-                            name
-                            checkSuite {{
-                                workflowRun {{
-                                workflow {{
-                                    name
-                                }}
-                                }}
-                            }}
-                            }}
-                            ... on StatusContext {{
-                            context
-                            state
-                            }}
-                        }}
-                        }}
-                    }}
-                    }}
-                }}
-                }}
-            }}
-            }}
-        }}
-        }}
-    }}
-    }}"""
-
-
-class GitHubRepo:
-    def __init__(self, user, repo, token):
-        self.token = token
-        self.user = user
-        self.repo = repo
-        self.base = f"https://api.github.com/repos/{user}/{repo}/"
+from typing import Dict, Tuple, Any, List, Optional, Iterable, Iterator, Set
+
+from git_utils import (
+    GitHubRepo,
+    PageSizer,
+    Telemetry,
+    TokenPool,
+    WriteScheduler,
+    graphql_rate_limit,
+    parse_remote,
+    git,
+)
+from mention_index import MentionIndex, find_reviewers
+from models import PR, parse_time, format_time
+
+
+PR_FIELDS = """
+            number
+            url
+            body
+            isDraft
+            state
+            updatedAt
+            author {
+                login
+            }
+            reviews(last:100) {
+                nodes {
+                    author { login }
+                    comments(last:100) {
+                        nodes {
+                            id
+                            updatedAt
+                            bodyText
+                        }
+                    }
+                }
+            }
+            publishedAt
+            comments(last:100) {
+                nodes {
+                    id
+                    authorAssociation
+                    bodyText
+                    updatedAt
+                    author {
+                        login
+                    }
+                }
+            }
+"""
 
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.token}",
-        }
 
-    def graphql(self, query: str) -> Dict[str, Any]:
-        return self._post("https://api.github.com/graphql", {"query": query})
-
-    def _post(self, full_url: str, body: Dict[str, Any]) -> Dict[str, Any]:
-        print("Requesting", full_url)
-        req = request.Request(full_url, headers=self.headers(), method="POST")
-        req.add_header("Content-Type", "application/json; charset=utf-8")
-        data = json.dumps(body)
-        data = data.encode("utf-8")
-        req.add_header("Content-Length", len(data))
-
-        with request.urlopen(req, data) as response:
-            response = json.loads(response.read())
-        return response
-
-    def post(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        return self._post(self.base + url, data)
-
-    def get(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers())
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-    def delete(self, url: str) -> Dict[str, Any]:
-        url = self.base + url
-        print("Requesting", url)
-        req = request.Request(url, headers=self.headers(), method="DELETE")
-        with request.urlopen(req) as response:
-            response = json.loads(response.read())
-        return response
-
-
-def parse_remote(remote: str) -> Tuple[str, str]:
+def prs_index_query(
+    user: str, repo: str, cursor: str = None, page_size: int = 100
+):
     """
-    Get a GitHub (user, repo) pair out of a git remote
+    Just enough about each open PR to decide whether it needs a closer look,
+    ordered from most to least recently updated
     """
-    if remote.startswith("https://"):
-        # Parse HTTP remote
-        parts = remote.split("/")
-        if len(parts) < 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return parts[-2], parts[-1].replace(".git", "")
-    else:
-        # Parse SSH remote
-        m = re.search(r":(.*)/(.*)\.git", remote)
-        if m is None or len(m.groups()) != 2:
-            raise RuntimeError(f"Unable to parse remote '{remote}'")
-        return m.groups()
-
-
-def git(command):
-    proc = subprocess.run(["git"] + command, stdout=subprocess.PIPE, check=True)
-    return proc.stdout.decode().strip()
-
-
-def prs_query(user: str, repo: str, cursor: str = None):
     after = ""
     if cursor is not None:
-        after = f', before:"{cursor}"'
+        after = f', after:"{cursor}"'
     return f"""
-        {{
+        query PRsIndex {{
+    rateLimit {{ cost remaining }}
     repository(name: "{repo}", owner: "{user}") {{
-        pullRequests(states: [OPEN], last: 10{after}) {{
-        edges {{
-            cursor
+        pullRequests(states: [OPEN], first: {page_size}, orderBy: {{field: UPDATED_AT, direction: DESC}}{after}) {{
+        pageInfo {{
+            hasNextPage
+            endCursor
         }}
         nodes {{
             number
-            url
-            body
             isDraft
-            author {{
-                login
-            }}
-            reviews(last:100) {{
-                nodes {{
-                    author {{ login }}
-                    comments(last:100) {{
-                        nodes {{
-                            updatedAt
-                            bodyText
-                        }}
-                    }}
-                }}
-            }}
             publishedAt
-            comments(last:100) {{
-                nodes {{
-                    authorAssociation
-                    bodyText
-                    updatedAt
-                    author {{
-                        login
-                    }}
-                }}
-            }}
+            updatedAt
         }}
         }}
     }}
@@ -192,68 +110,106 @@ def prs_query(user: str, repo: str, cursor: str = None):
     """
 
 
+def prs_by_number_query(user: str, repo: str, numbers: List[int]):
+    prs = "\n".join(
+        f"pr{number}: pullRequest(number: {number}) {{ {PR_FIELDS} }}"
+        for number in numbers
+    )
+    return f"""
+        query PRsByNumber {{
+    rateLimit {{ cost remaining }}
+    repository(name: "{repo}", owner: "{user}") {{
+        {prs}
+    }}
+    }}
+    """
+
+
 WAIT_TIME = datetime.timedelta(minutes=1)
+# How long to wait before pinging a PR again if nothing has happened since
+PING_BACKOFF = datetime.timedelta(hours=24)
+# The most GitHub allows per page
+INDEX_PAGE_SIZE = 100
+# Each PR's details can be ~10k nodes, so batches start well under GitHub's
+# per-query node limit and are adjusted from there (see PageSizer)
+DETAIL_BATCH_SIZE = 20
+MAX_DETAIL_BATCH_SIZE = 50
+DETAIL_MAX_COST = 1000
 CUTOFF_PR_NUMBER = 0
 # CUTOFF_PR_NUMBER = 9000
 
 
-def find_reviewers(body: str) -> List[str]:
-    # print(f"Parsing body:\n{body}")
-    matches = re.findall(r"(cc( @[-A-Za-z0-9]+)+)", body, flags=re.MULTILINE)
-    matches = [full for full, last in matches]
-
-    # print("Found matches:", matches)
-    reviewers = []
-    for match in matches:
-        if match.startswith("cc "):
-            match = match.replace("cc ", "")
-        users = [x.strip() for x in match.split("@")]
-        reviewers += users
-
-    reviewers = set(x for x in reviewers if x != "")
-    return list(reviewers)
-
-
-def check_pr(pr):
-    published_at = datetime.datetime.strptime(pr["publishedAt"], "%Y-%m-%dT%H:%M:%SZ")
-    last_action = published_at
-
-    # GitHub counts comments left as part of a review separately than standalone
-    # comments
-    reviews = pr["reviews"]["nodes"]
-    review_comments = []
-    for review in reviews:
-        review_comments += review["comments"]["nodes"]
-
-    # Collate all comments
-    comments = pr["comments"]["nodes"] + review_comments
-
-    # Find the last date of any comment
-    for comment in comments:
-        commented_at = datetime.datetime.strptime(
-            comment["updatedAt"], "%Y-%m-%dT%H:%M:%SZ"
-        )
-        if commented_at > last_action:
-            last_action = commented_at
-
-    time_since_last_action = datetime.datetime.utcnow() - last_action
-
-    # Pull out reviewers from any cc @... text in a comment
-    cc_reviewers = [find_reviewers(c["bodyText"]) for c in comments]
-    cc_reviewers = [r for revs in cc_reviewers for r in revs]
+def ping_due(last_action: int, last_ping: Optional[int], now: int) -> bool:
+    """
+    A PR needs a ping once nothing has happened on it for WAIT_TIME, unless it
+    was already pinged (and nothing has happened since) less than PING_BACKOFF
+    ago. All times are in seconds since the epoch.
+    """
+    if now - last_action <= WAIT_TIME.total_seconds():
+        return False
+    if (
+        last_ping is not None
+        and last_action <= last_ping
+        and now - last_ping < PING_BACKOFF.total_seconds()
+    ):
+        return False
+    return True
+
+
+def check_pr(
+    pr,
+    mentions: Optional[MentionIndex] = None,
+    entry: Optional[Dict[str, Any]] = None,
+    now: Optional[int] = None,
+):
+    """
+    Get the reviewers to ping on 'pr' or None if it doesn't need a ping yet. If
+    given, 'entry' is the state saved for this PR by an earlier run and is
+    updated with what was found.
+    """
+    if entry is None:
+        entry = {}
+    if now is None:
+        now = int(time.time())
+
+    pr = PR(pr)
+
+    # Find the last date of any comment and pull out reviewers from any
+    # cc @... text in one go
+    last_action = pr.published_at
+    cc_reviewers = []
+    for comment in pr.comments():
+        if comment.updated_at > last_action:
+            last_action = comment.updated_at
+        if mentions is None:
+            cc_reviewers += find_reviewers(comment.body)
+        else:
+            cc_reviewers += mentions.reviewers(
+                comment.id, format_time(comment.updated_at), comment.body
+            )
+
+    time_since_last_action = datetime.timedelta(seconds=now - last_action)
 
     # Anyone that has left a review as a reviewer (this may include the PR
     # author since their responses count as reviews)
-    review_reviewers = list(set(r["author"]["login"] for r in reviews))
+    review_reviewers = list(set(r.author for r in pr.reviews() if r.author is not None))
 
     reviewers = cc_reviewers + review_reviewers
 
-    if time_since_last_action > WAIT_TIME:
+    if pr.updated_at is not None:
+        entry["updated_at"] = format_time(pr.updated_at)
+    entry["last_action"] = format_time(last_action)
+    entry["reviewers"] = reviewers
+    last_ping = entry.get("last_ping")
+    if last_ping is not None:
+        last_ping = parse_time(last_ping)
+
+    if ping_due(last_action, last_ping, now):
         print(
             "    Pinging reviewers",
             reviewers,
             "on",
-            pr["url"],
+            pr.url,
             "since it has been",
             time_since_last_action,
             "since anything happened on that PR",
@@ -263,7 +219,14 @@ def check_pr(pr):
     return None
 
 
-def ping_reviewers(pr, reviewers):
+def ping_due_from_state(entry: Dict[str, Any], now: int) -> bool:
+    last_ping = entry.get("last_ping")
+    if last_ping is not None:
+        last_ping = parse_time(last_ping)
+    return ping_due(parse_time(entry["last_action"]), last_ping, now)
+
+
+def ping_reviewers(github, pr, reviewers):
     reviewers = [f"@{r}" for r in reviewers]
     text = (
         "It has been a while since this PR was updated, "
@@ -272,53 +235,480 @@ def ping_reviewers(pr, reviewers):
     )
     r = github.post(f"issues/{pr['number']}/comments", {"body": text})
     print(r)
+    return r
+
+
+def check_prs(
+    github,
+    writes: WriteScheduler,
+    prs: Iterable[Dict[str, Any]],
+    dry_run: bool,
+    mentions: Optional[MentionIndex] = None,
+    pr_states: Optional[Dict[str, Any]] = None,
+    pings: Optional[Dict[int, futures.Future]] = None,
+) -> Tuple[List[int], Dict[int, futures.Future]]:
+    """
+    Queue up pings to reviewers on any PRs that need it, returning the numbers
+    of the PRs whose timers haven't run out yet along with the queued pings.
+    Each PR's entry in 'pr_states' (keyed by number) is created or updated.
+    Pings are added to 'pings' as they're queued, so they're known about even
+    if reading 'prs' fails partway through.
+    """
+    if pr_states is None:
+        pr_states = {}
+    if pings is None:
+        pings = {}
+
+    # Don't look at draft PRs at all
+    prs = (pr for pr in prs if not pr["isDraft"])
+
+    # Don't look at super old PRs
+    prs = (pr for pr in prs if pr["number"] > CUTOFF_PR_NUMBER)
+
+    # Ping reviewers on each PR in the response if necessary
+    waiting = []
+    now = int(github.now())
+    for pr in prs:
+        print("Checking", pr["url"])
+        entry = pr_states.setdefault(str(pr["number"]), {})
+        reviewers = check_pr(pr, mentions, entry, now)
+        if reviewers is None:
+            waiting.append(pr["number"])
+        elif not dry_run:
+            pings[pr["number"]] = writes.submit(ping_reviewers, github, pr, reviewers)
+
+    return waiting, pings
+
+
+def query_cost(r: Dict[str, Any]) -> Optional[int]:
+    rate_limit = graphql_rate_limit(r)
+    return None if rate_limit is None else rate_limit["cost"]
+
+
+def could_be_stale(pr, now: int) -> bool:
+    """
+    A PR's last action can't be later than its updatedAt, so anything updated
+    within WAIT_TIME can't need a ping yet
+    """
+    return now - parse_time(pr["updatedAt"]) > WAIT_TIME.total_seconds()
+
+
+def scan(
+    github,
+    writes: WriteScheduler,
+    state: Dict[str, Any],
+    dry_run: bool,
+    mentions: Optional[MentionIndex] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Walk the open PRs from most to least recently updated, stopping at the
+    watermark from the last run (if there is one). Only PRs that could need a
+    ping have their reviews and comments fetched. PRs that last run was still
+    waiting on are checked again too, since their timers can run out without
+    anything on the PR changing. PRs whose updatedAt matches what was saved
+    last time are decided from the saved state and only fetched if that says
+    they're due a ping.
+
+    PRs are fetched from least to most recently updated. If 'deadline' (a
+    time.monotonic() value) passes first, the PRs left over are saved as
+    pending and fetched first thing next run. Returns the state for the next
+    run.
+    """
+    name = f"{github.user}/{github.repo}"
+    watermark = state.get("watermark")
+    new_watermark = watermark
+    old_pr_states = state.get("prs", {})
+    pr_states: Dict[str, Any] = {}
+    now = int(github.now())
+    seen = set()
+    candidates = []
+    # updatedAt of each candidate, to fetch the stalest first
+    updated_at: Dict[int, str] = {}
+    waiting = []
+    pings = {}
+    cursor = None
+    index_sizer = PageSizer(f"{name} PRsIndex", INDEX_PAGE_SIZE, 10, INDEX_PAGE_SIZE)
+    detail_sizer = PageSizer(
+        f"{name} PRsByNumber",
+        DETAIL_BATCH_SIZE,
+        1,
+        MAX_DETAIL_BATCH_SIZE,
+        max_cost=DETAIL_MAX_COST,
+    )
+
+    def check_saved(number: int) -> bool:
+        """
+        Carry over the saved state for 'number', returning True if that's
+        enough to tell it isn't due a ping
+        """
+        entry = old_pr_states.get(str(number))
+        if entry is None:
+            return False
+        pr_states[str(number)] = entry
+        if ping_due_from_state(entry, now):
+            return False
+        waiting.append(number)
+        return True
+
+    while True:
+        r: Dict[str, Any] = {}
+        reached_watermark = False
+        try:
+            for pr in github.graphql_stream(
+                prs_index_query(github.user, github.repo, cursor, index_sizer.size),
+                ["data", "repository", "pullRequests", "nodes"],
+                r,
+            ):
+                # Timestamps are all ISO 8601 in UTC so they compare as
+                # strings. PRs updated in the same second as the watermark are
+                # checked again in case they were missed last time.
+                if watermark is not None and pr["updatedAt"] < watermark:
+                    reached_watermark = True
+                    continue
+
+                seen.add(pr["number"])
+                if new_watermark is None or pr["updatedAt"] > new_watermark:
+                    new_watermark = pr["updatedAt"]
+
+                # Don't look at draft PRs or super old PRs at all
+                if pr["isDraft"] or pr["number"] <= CUTOFF_PR_NUMBER:
+                    continue
+
+                entry = old_pr_states.get(str(pr["number"]))
+                updated_at[pr["number"]] = pr["updatedAt"]
+                if entry is not None and entry["updated_at"] == pr["updatedAt"]:
+                    # Nothing has changed since it was last checked
+                    if check_saved(pr["number"]):
+                        continue
+                    candidates.append(pr["number"])
+                elif could_be_stale(pr, now):
+                    candidates.append(pr["number"])
+                else:
+                    # Hold on to e.g. when it was last pinged for when it's
+                    # re-checked next run
+                    if entry is not None:
+                        pr_states[str(pr["number"])] = entry
+                    waiting.append(pr["number"])
+        except error.HTTPError as e:
+            # Nothing on the page has been looked at yet, so it can be fetched
+            # again (smaller) from the same cursor
+            if not index_sizer.failed(e):
+                raise
+            continue
+        index_sizer.record(github.last_latency(), query_cost(r))
+
+        page = r["data"]["repository"]["pullRequests"]
+        if reached_watermark or not page["pageInfo"]["hasNextPage"]:
+            # Reached the end or PRs that were already checked
+            break
+        cursor = page["pageInfo"]["endCursor"]
+
+    # Anything not seen above hasn't been updated since the last run, so its
+    # saved state (if any) is still accurate
+    stale_timers = [n for n in state.get("waiting", []) if n not in seen]
+    print(f"{name}: re-checking {len(stale_timers)} PRs still waiting from last run")
+    candidates += [n for n in stale_timers if not check_saved(n)]
+    for number in stale_timers:
+        entry = old_pr_states.get(str(number), {})
+        updated_at.setdefault(number, entry.get("updated_at", ""))
+
+    # Likewise for the PRs last run ran out of time before getting to
+    resumed = {
+        int(n): ts for n, ts in state.get("pending", {}).items() if int(n) not in seen
+    }
+    print(f"{name}: resuming {len(resumed)} PRs left over from last run")
+    for number, ts in resumed.items():
+        updated_at.setdefault(number, ts)
+
+    # Keep anything learned about a PR before, e.g. when it was last pinged
+    for number in candidates + list(resumed):
+        if str(number) in old_pr_states:
+            pr_states.setdefault(str(number), old_pr_states[str(number)])
+
+    # The PRs that have gone the longest without an update are the most likely
+    # to need a ping, so get to them before the time runs out. The leftovers
+    # go ahead of everything else though, or a run that keeps running out of
+    # time could starve them behind newly found PRs indefinitely.
+    leftovers = sorted(resumed, key=lambda n: updated_at.get(n, ""))
+    candidates = leftovers + sorted(
+        set(candidates) - set(resumed), key=lambda n: updated_at.get(n, "")
+    )
+    pending: Dict[str, str] = {}
+
+    print(f"{name}: fetching details for {len(candidates)} PRs")
+    def fetch(numbers: List[int], r: Dict[str, Any], fetched: Set[int]) -> Iterator[Any]:
+        for _, pr in github.graphql_stream(
+            prs_by_number_query(github.user, github.repo, numbers),
+            ["data", "repository"],
+            r,
+        ):
+            if pr is None:
+                continue
+            fetched.add(pr["number"])
+            if pr["state"] == "OPEN":
+                yield pr
+
+    def record_ping(number: int, ping: futures.Future) -> None:
+        if ping.exception() is None:
+            pr_states[str(number)]["last_ping"] = ping.result()["updated_at"]
+
+    remaining = candidates
+    try:
+        while len(remaining) > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                pending = {str(n): updated_at.get(n, "") for n in remaining}
+                print(
+                    f"{name}: out of time, leaving {len(pending)} PRs for next run"
+                )
+                break
+            numbers = remaining[: detail_sizer.size]
+            # Each PR is checked as soon as it has been downloaded rather than
+            # holding the whole batch in memory
+            r: Dict[str, Any] = {}
+            fetched: Set[int] = set()
+            queued = len(pings)
+            try:
+                batch_waiting, _ = check_prs(
+                    github,
+                    writes,
+                    fetch(numbers, r, fetched),
+                    dry_run,
+                    mentions,
+                    pr_states,
+                    pings,
+                )
+            except error.HTTPError as e:
+                # This is raised before any PRs are handed out, so the batch
+                # can be retried as is
+                if not detail_sizer.failed(e):
+                    raise
+                continue
+            waiting += batch_waiting
+            # Remember each ping as soon as it's posted
+            for number in list(pings)[queued:]:
+                pings[number].add_done_callback(functools.partial(record_ping, number))
+            remaining = remaining[len(numbers) :]
+
+            # GitHub also gives up on queries that run too long by returning
+            # what it has so far with an error, so fetch anything that's
+            # missing again in smaller batches. PRs that are gone (closed and
+            # deleted) come back as NOT_FOUND.
+            errors = [e for e in r.get("errors", []) if e.get("type") != "NOT_FOUND"]
+            missing = [n for n in numbers if n not in fetched]
+            if len(errors) > 0 and len(missing) > 0:
+                if detail_sizer.shrink(errors[0]["message"]):
+                    remaining = missing + remaining
+                else:
+                    message = errors[0]["message"]
+                    print(f"{name}: couldn't fetch {missing}: {message}")
+                    waiting += missing
+                continue
+            detail_sizer.record(github.last_latency(), query_cost(r))
+    except BaseException:
+        # Whatever was pinged before this has already been posted, so save
+        # that into the state this run started from (which is kept when a scan
+        # fails) or those PRs would be pinged again next run
+        futures.wait(pings.values())
+        saved = state.setdefault("prs", {})
+        for number, ping in pings.items():
+            if ping.exception() is None:
+                record_ping(number, ping)
+                saved[str(number)] = pr_states[str(number)]
+        raise
+
+    # Pings that didn't go through are tried again next run, the rest are
+    # remembered so the same PR isn't pinged again until there's new activity
+    # or PING_BACKOFF has passed
+    futures.wait(pings.values())
+    failed = 0
+    for number, ping in pings.items():
+        if ping.exception() is not None:
+            failed += 1
+            waiting.append(number)
+        else:
+            # The callback may not have run yet
+            record_ping(number, ping)
+
+    print(
+        f"{name}: {len(seen)} PRs updated since last run, "
+        f"{len(pings) - failed} pinged, {failed} pings failed, "
+        f"{len(waiting)} waiting"
+    )
+
+    # Only PRs that will be seen again need their state kept: anything updated
+    # (including by a ping) will show up above the watermark and anything
+    # waiting or pending is re-checked
+    keep = set(str(n) for n in waiting + list(seen) + list(pings)) | set(pending)
+    pr_states = {n: entry for n, entry in pr_states.items() if n in keep}
+
+    return {
+        "watermark": new_watermark,
+        "waiting": waiting,
+        "pending": pending,
+        "prs": pr_states,
+    }
+
+
+def load_state(path: str, repos: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    The state saved for each repo (as owner/repo) by the last run
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    if "repos" in state:
+        return state["repos"]
+    # Saved before there could be more than one repo, so it's only usable if
+    # there still isn't
+    if len(state) > 0 and len(repos) == 1:
+        return {repos[0]: state}
+    return {}
+
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
 
 
 if __name__ == "__main__":
     help = "Comment on languishing issues and PRs"
     parser = argparse.ArgumentParser(description=help)
     parser.add_argument("--remote", default="origin", help="ssh remote to parse")
+    parser.add_argument(
+        "--repos",
+        nargs="+",
+        metavar="OWNER/REPO",
+        help="repos to scan instead of the one --remote points at",
+    )
+    parser.add_argument(
+        "--max-repos", type=int, default=4, help="max repos to scan at once"
+    )
     parser.add_argument("--dry-run", action="store_true", help="don't update GitHub")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only check PRs updated since the last run (see --state-file)",
+    )
+    parser.add_argument(
+        "--state-file",
+        default="ping_state.json",
+        help="where --incremental keeps its watermark between runs",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="seconds to spend fetching PR details before saving the rest for "
+        "the next --incremental run",
+    )
+    parser.add_argument(
+        "--max-writes", type=int, default=4, help="max concurrent comment posts"
+    )
+    parser.add_argument(
+        "--mention-index",
+        help="SQLite file to remember the cc'ed reviewers in each comment in",
+    )
+    parser.add_argument(
+        "--telemetry",
+        default=os.getenv("GITHUB_TELEMETRY"),
+        help="JSON lines file to append a record of every GitHub request to",
+    )
+    parser.add_argument(
+        "--ping-backoff-hours",
+        type=float,
+        default=PING_BACKOFF.total_seconds() / 3600,
+        help="with --incremental, don't ping a PR again for this long unless something happens on it",
+    )
     args = parser.parse_args()
+    PING_BACKOFF = datetime.timedelta(hours=args.ping_backoff_hours)
 
-    remote = git(["config", "--get", f"remote.{args.remote}.url"])
-    user, repo = parse_remote(remote)
+    if args.repos is not None:
+        repos = list(dict.fromkeys(args.repos))
+    else:
+        remote = git(["config", "--get", f"remote.{args.remote}.url"])
+        repos = ["/".join(parse_remote(remote))]
 
     print(
         "Running with:\n"
         f"  time cutoff: {WAIT_TIME}\n"
+        f"  ping backoff: {PING_BACKOFF}\n"
         f"  number cutoff: {CUTOFF_PR_NUMBER}\n"
         f"  dry run: {args.dry_run}\n"
-        f"  user/repo: {user}/{repo}\n",
+        f"  incremental: {args.incremental}\n"
+        f"  repos: {', '.join(repos)}\n",
         end="",
     )
 
-    github = GitHubRepo(token=os.environ["GITHUB_TOKEN"], user=user, repo=repo)
-
-    q = prs_query(user, repo)
-    r = github.graphql(q)
-
-    # Loop until all PRs have been checked
-    while True:
-        prs = r["data"]["repository"]["pullRequests"]["nodes"]
-
-        # Don't look at draft PRs at all
-        prs = [pr for pr in prs if not pr["isDraft"]]
-
-        # Don't look at super old PRs
-        prs = [pr for pr in prs if pr["number"] > CUTOFF_PR_NUMBER]
-
-        # Ping reviewers on each PR in the response if necessary
-        for pr in prs:
-            print("Checking", pr["url"])
-            reviewers = check_pr(pr)
-            if reviewers is not None and not args.dry_run:
-                ping_reviewers(pr, reviewers)
-
-        edges = r["data"]["repository"]["pullRequests"]["edges"]
-        if len(edges) == 0:
-            # No more results to check
-            break
+    telemetry = Telemetry(args.telemetry)
+    # Every repo draws on the same tokens' rate limit budgets (and one
+    # connection pool, since they're on the same host)
+    tokens = TokenPool.from_env()
+    githubs = {}
+    for name in repos:
+        user, repo = name.split("/")
+        githubs[name] = GitHubRepo(
+            token=tokens,
+            user=user,
+            repo=repo,
+            telemetry=telemetry,
+        )
 
-        cursor = edges[0]["cursor"]
-        r = github.graphql(prs_query(user, repo, cursor))
+    mentions = None
+    if args.mention_index is not None:
+        mentions = MentionIndex(args.mention_index)
+    writes = WriteScheduler(max_workers=args.max_writes, rate_limits=tokens)
+    if args.incremental:
+        states = load_state(args.state_file, repos)
+    else:
+        states = {}
+
+    deadline = None
+    if args.time_budget is not None:
+        deadline = time.monotonic() + args.time_budget
+
+    with futures.ThreadPoolExecutor(max_workers=args.max_repos) as executor:
+        scans = {
+            name: executor.submit(
+                scan,
+                github,
+                writes,
+                # A failed scan still records its pings here
+                states.setdefault(name, {}),
+                args.dry_run,
+                mentions,
+                deadline,
+            )
+            for name, github in githubs.items()
+        }
+    failed_repos = []
+    for name, future in scans.items():
+        e = future.exception()
+        if e is not None:
+            # Its saved state is kept as is for the next run
+            print(f"{name}: scan failed: {e}")
+            failed_repos.append(name)
+        else:
+            states[name] = future.result()
+    failed_writes = writes.shutdown()
+
+    if mentions is not None:
+        print(mentions.summary())
+        mentions.close()
+
+    if args.incremental and not args.dry_run:
+        save_state(args.state_file, {"repos": states})
+
+    print(telemetry.summary())
+    telemetry.close()
+
+    if len(failed_repos) > 0:
+        print(f"{len(failed_repos)} repos failed: {', '.join(failed_repos)}")
+    if len(failed_writes) > 0:
+        print(f"{len(failed_writes)} pings failed")
+    if len(failed_repos) > 0 or len(failed_writes) > 0:
+        sys.exit(1)
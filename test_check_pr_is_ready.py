@@ -0,0 +1,170 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from typing import Dict, Any, List, Optional
+
+from check_pr_is_ready import is_pr_ready, fetch_contexts
+
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+def pr(review_decision: Optional[str], rollup: Optional[str]) -> Dict[str, Any]:
+    """
+    A PR node like the ones in a CommitPRs response
+    """
+    return {
+        "number": 1,
+        "reviewDecision": review_decision,
+        "labels": {"nodes": []},
+        "commits": {
+            "nodes": [
+                {
+                    "commit": {
+                        "oid": SHA,
+                        "statusCheckRollup": None
+                        if rollup is None
+                        else {"state": rollup},
+                    }
+                }
+            ]
+        },
+    }
+
+
+def check_run(name: str, conclusion: str) -> Dict[str, Any]:
+    return {
+        "conclusion": conclusion,
+        "status": "COMPLETED",
+        "name": name,
+        "checkSuite": {"workflowRun": {"workflow": {"name": "CI"}}},
+    }
+
+
+def status(context: str, state: str) -> Dict[str, Any]:
+    return {"context": context, "state": state}
+
+
+def contexts_page(
+    nodes: List[Dict[str, Any]], end_cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    A CommitContexts response, with another page after it if 'end_cursor' is set
+    """
+    return {
+        "data": {
+            "rateLimit": {"cost": 1, "remaining": 4999},
+            "repository": {
+                "object": {
+                    "statusCheckRollup": {
+                        "contexts": {
+                            "pageInfo": {
+                                "hasNextPage": end_cursor is not None,
+                                "endCursor": end_cursor,
+                            },
+                            "nodes": nodes,
+                        }
+                    }
+                }
+            },
+        }
+    }
+
+
+class RecordedGitHub:
+    """
+    Serves recorded CommitContexts pages in order and keeps the queries
+    """
+
+    def __init__(self, pages: List[Dict[str, Any]]):
+        self.user = "owner"
+        self.repo = "repo"
+        self.pages = list(pages)
+        self.queries: List[str] = []
+
+    def graphql(self, query: str) -> Dict[str, Any]:
+        self.queries.append(query)
+        return self.pages.pop(0)
+
+
+def test_not_approved():
+    github = RecordedGitHub([])
+    assert not is_pr_ready(pr("REVIEW_REQUIRED", "SUCCESS"), github)
+    assert not is_pr_ready(pr(None, "SUCCESS"), github)
+    assert github.queries == []
+
+
+def test_no_rollup():
+    github = RecordedGitHub([])
+    assert not is_pr_ready(pr("APPROVED", None), github)
+    assert github.queries == []
+
+
+def test_failing_or_pending_rollup():
+    github = RecordedGitHub([])
+    for state in ["FAILURE", "PENDING", "ERROR", "EXPECTED"]:
+        assert not is_pr_ready(pr("APPROVED", state), github)
+    # The rollup is enough, contexts are never fetched
+    assert github.queries == []
+
+
+def test_all_contexts_pass():
+    github = RecordedGitHub(
+        [contexts_page([check_run("build", "SUCCESS"), status("ci/lint", "SUCCESS")])]
+    )
+    assert is_pr_ready(pr("APPROVED", "SUCCESS"), github)
+    assert len(github.queries) == 1
+
+
+def test_failing_context():
+    github = RecordedGitHub(
+        [contexts_page([check_run("build", "SUCCESS"), status("ci/lint", "FAILURE")])]
+    )
+    assert not is_pr_ready(pr("APPROVED", "SUCCESS"), github)
+
+
+def test_neutral_or_skipped_context():
+    # The rollup counts these as passing
+    for conclusion in ["NEUTRAL", "SKIPPED"]:
+        nodes = [check_run("build", "SUCCESS"), check_run("docs", conclusion)]
+        github = RecordedGitHub([contexts_page(nodes)])
+        assert not is_pr_ready(pr("APPROVED", "SUCCESS"), github)
+
+
+def test_contexts_across_pages():
+    first = [check_run(f"job-{i}", "SUCCESS") for i in range(100)]
+    second = [status(f"ci/{i}", "SUCCESS") for i in range(50)]
+    github = RecordedGitHub(
+        [contexts_page(first, end_cursor="Y3Vyc29yOjEwMA=="), contexts_page(second)]
+    )
+
+    contexts = fetch_contexts(github, SHA)
+
+    assert contexts == first + second
+    assert len(github.queries) == 2
+    assert "after" not in github.queries[0]
+    assert 'after:"Y3Vyc29yOjEwMA=="' in github.queries[1]
+
+
+def test_failing_context_on_second_page():
+    first = [check_run(f"job-{i}", "SUCCESS") for i in range(100)]
+    second = [status("ci/0", "SUCCESS"), status("ci/1", "FAILURE")]
+    github = RecordedGitHub(
+        [contexts_page(first, end_cursor="Y3Vyc29yOjEwMA=="), contexts_page(second)]
+    )
+    assert not is_pr_ready(pr("APPROVED", "SUCCESS"), github)
+    assert len(github.queries) == 2
@@ -0,0 +1,104 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import json
+import random
+from typing import Dict, Any, Iterator, List, Tuple
+
+from git_utils import stream_json
+
+
+def split(body: bytes, rng: random.Random, max_size: int) -> Iterator[bytes]:
+    """
+    'body' in chunks of random sizes, so boundaries land everywhere (including
+    inside numbers and multi-byte characters)
+    """
+    i = 0
+    while i < len(body):
+        size = rng.randint(1, max_size)
+        yield body[i : i + size]
+        i += size
+
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randint(-(10 ** 6), 10 ** 6)
+    if kind == 1:
+        return rng.choice([1.5, 12.5, -0.25, 1e5, 2.5e-3, 1e100, 123456.789])
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return rng.choice(["", "cc @user", 'quote " and \\ slash', "é☃ unicode"])
+    if kind == 4:
+        return "x" * rng.randrange(200)
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {
+        f"k{i}": random_value(rng, depth + 1) for i in range(rng.randrange(5))
+    }
+
+
+def decode(
+    path: List[str], chunks: Iterator[bytes]
+) -> Tuple[Dict[str, Any], List[Any]]:
+    envelope: Dict[str, Any] = {}
+    streamed = list(stream_json(chunks, path, envelope))
+    return envelope, streamed
+
+
+def test_numbers_split_anywhere():
+    for doc in [{"a": [1.5]}, {"a": [12.5]}, {"a": [1e5]}, {"a": [-2.5e-3, 10]}]:
+        body = json.dumps(doc).encode()
+        for size in range(1, len(body) + 1):
+            chunks = (body[i : i + size] for i in range(0, len(body), size))
+            envelope, items = decode(["a"], chunks)
+            assert items == doc["a"]
+            assert envelope == {"a": []}
+
+
+def test_matches_json_loads():
+    rng = random.Random(0)
+    for _ in range(500):
+        doc = {
+            "data": {
+                "repository": {
+                    f"pr{i}": random_value(rng) for i in range(rng.randrange(6))
+                },
+                "rateLimit": {"cost": rng.randint(1, 100), "remaining": 4999},
+            },
+            "n": random_value(rng),
+        }
+        body = json.dumps(doc, ensure_ascii=rng.random() < 0.5).encode()
+        chunks = split(body, rng, rng.choice([1, 2, 3, 7, 64]))
+        envelope, members = decode(["data", "repository"], chunks)
+
+        expected = json.loads(body)
+        assert dict(members) == expected["data"]["repository"]
+        expected["data"]["repository"] = {}
+        assert envelope == expected
+
+
+def test_array_matches_json_loads():
+    rng = random.Random(1)
+    for _ in range(500):
+        items = [random_value(rng) for _ in range(rng.randrange(10))]
+        body = json.dumps({"items": items, "total": len(items)}).encode()
+        chunks = split(body, rng, rng.choice([1, 2, 5, 16]))
+        envelope, streamed = decode(["items"], chunks)
+        assert streamed == json.loads(body)["items"]
+        assert envelope == {"items": [], "total": len(items)}
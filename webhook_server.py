@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import os
+import sys
+import hmac
+import json
+import hashlib
+import argparse
+import threading
+import collections
+import http.server
+from urllib import request
+from typing import Dict, Tuple, Any, Optional, Set
+
+from git_utils import GitHubRepo, ResponseCache, TokenPool, WriteScheduler
+from cc_reviewers import CC_ACTIONS, Collaborators, add_reviewers
+from mention_index import MentionIndex
+from check_pr_is_ready import check_commits
+
+
+def sign(secret: bytes, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: bytes, body: bytes, signature: Optional[str]) -> bool:
+    if signature is None:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature)
+
+
+class CoalescingQueue:
+    """
+    A work queue where putting a key that is already waiting replaces its
+    payload instead of adding another entry, so a burst of events for the same
+    PR turns into a single run with the latest data. A key is never handed to
+    two workers at once.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._order: "collections.deque[Tuple[str, Any]]" = collections.deque()
+        self._pending: Dict[Tuple[str, Any], Any] = {}
+        self._running: Set[Tuple[str, Any]] = set()
+        self.coalesced = 0
+
+    def put(self, key: Tuple[str, Any], payload: Any) -> None:
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+            else:
+                self._order.append(key)
+            self._pending[key] = payload
+            self._cond.notify()
+
+    def get(self) -> Tuple[Tuple[str, Any], Any]:
+        with self._cond:
+            while True:
+                for key in self._order:
+                    if key not in self._running:
+                        self._order.remove(key)
+                        self._running.add(key)
+                        return key, self._pending.pop(key)
+                self._cond.wait()
+
+    def done(self, key: Tuple[str, Any]) -> None:
+        with self._cond:
+            self._running.discard(key)
+            self._cond.notify_all()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._order)
+
+
+def event_key(event: str, payload: Dict[str, Any]) -> Optional[Tuple[str, Any]]:
+    """
+    Map a webhook to the work it needs, or None if it doesn't need any. Checks
+    for readiness are keyed by head commit since that's all a status event has.
+    """
+    repo = payload.get("repository", {}).get("full_name")
+    if event == "pull_request":
+        if payload.get("action") not in CC_ACTIONS:
+            return None
+        return ("cc", (repo, payload["pull_request"]["number"]))
+    elif event == "pull_request_review":
+        return ("ready", (repo, payload["pull_request"]["head"]["sha"]))
+    elif event == "status":
+        return ("ready", (repo, payload["sha"]))
+    return None
+
+
+class Dispatcher:
+    def __init__(
+        self,
+        tokens: TokenPool,
+        writes: WriteScheduler,
+        mentions: Optional[MentionIndex] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.tokens = tokens
+        self.writes = writes
+        self.mentions = mentions
+        self.cache = cache
+        self.queue = CoalescingQueue()
+        self._repos: Dict[str, GitHubRepo] = {}
+        self._collaborators: Dict[str, Collaborators] = {}
+        self._lock = threading.Lock()
+
+    def github(self, full_name: str) -> GitHubRepo:
+        with self._lock:
+            if full_name not in self._repos:
+                user, repo = full_name.split("/")
+                self._repos[full_name] = GitHubRepo(
+                    token=self.tokens,
+                    user=user,
+                    repo=repo,
+                    cache=self.cache,
+                )
+            return self._repos[full_name]
+
+    def collaborators(self, full_name: str) -> Collaborators:
+        github = self.github(full_name)
+        with self._lock:
+            if full_name not in self._collaborators:
+                self._collaborators[full_name] = Collaborators(github)
+            return self._collaborators[full_name]
+
+    def handle(self, key: Tuple[str, Any], payload: Dict[str, Any]) -> None:
+        kind, (full_name, target) = key
+        github = self.github(full_name)
+        if kind == "cc":
+            print(f"Adding reviewers on {full_name}#{target}")
+            # Done before returning so the queue doesn't hand this PR to
+            # another worker while it's still being handled
+            self.writes.run(
+                add_reviewers,
+                github,
+                payload["pull_request"],
+                self.mentions,
+                self.collaborators(full_name),
+            )
+        elif kind == "ready":
+            print(f"Checking readiness of {full_name}@{target}")
+            check_commits(github, self.writes, [target])
+
+    def work(self) -> None:
+        while True:
+            key, payload = self.queue.get()
+            try:
+                self.handle(key, payload)
+            except Exception as e:
+                print(f"Failed to handle {key}: {e}")
+            finally:
+                self.queue.done(key)
+
+
+def make_handler(secret: bytes, dispatcher: Dispatcher):
+    class WebhookHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, message: str = "") -> None:
+            body = message.encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(
+                secret, body, self.headers.get("X-Hub-Signature-256")
+            ):
+                self._reply(401, "bad signature")
+                return
+
+            event = self.headers.get("X-GitHub-Event", "")
+            payload = json.loads(body)
+            key = event_key(event, payload)
+            if key is None:
+                self._reply(204)
+                return
+
+            dispatcher.queue.put(key, payload)
+            self._reply(202, "queued")
+
+    return WebhookHandler
+
+
+def replay(url: str, secret: bytes, path: str) -> None:
+    """
+    Send each {"event": ..., "payload": ...} line in 'path' to a running
+    server, signed the same way GitHub would
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            item = json.loads(line)
+            body = json.dumps(item["payload"]).encode()
+            req = request.Request(url, data=body, method="POST")
+            req.add_header("Content-Type", "application/json")
+            req.add_header("X-GitHub-Event", item["event"])
+            req.add_header("X-Hub-Signature-256", sign(secret, body))
+            with request.urlopen(req) as response:
+                print(item["event"], response.status)
+
+
+if __name__ == "__main__":
+    help = "Serve GitHub webhooks for the cc and ready-for-merge bots"
+    parser = argparse.ArgumentParser(description=help)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument(
+        "--mention-index",
+        help="SQLite file to remember the cc'ed reviewers in each PR body in",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.getenv("GITHUB_CACHE_DIR"),
+        help="directory to keep ETag-validated responses (e.g. the requested "
+        "reviewers and collaborators) in",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="EVENTS_JSONL",
+        help="instead of serving, send the events in this file to --host/--port",
+    )
+    args = parser.parse_args()
+
+    secret = os.environ["WEBHOOK_SECRET"].encode()
+
+    if args.replay is not None:
+        replay(f"http://{args.host}:{args.port}/", secret, args.replay)
+        sys.exit(0)
+
+    tokens = TokenPool.from_env()
+    # Nothing ever waits on the writes, so log failures as they happen
+    writes = WriteScheduler(rate_limits=tokens, keep_futures=False)
+    mentions = None
+    if args.mention_index is not None:
+        # The server runs indefinitely, so don't hold any writes back
+        mentions = MentionIndex(args.mention_index, commit_every=1)
+    cache = None
+    if args.cache_dir is not None:
+        cache = ResponseCache(args.cache_dir)
+    dispatcher = Dispatcher(
+        tokens=tokens,
+        writes=writes,
+        mentions=mentions,
+        cache=cache,
+    )
+    for _ in range(args.workers):
+        threading.Thread(target=dispatcher.work, daemon=True).start()
+
+    server = http.server.ThreadingHTTPServer(
+        (args.host, args.port), make_handler(secret, dispatcher)
+    )
+    print(f"Listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    writes.shutdown()
+    if mentions is not None:
+        mentions.close()
+    if cache is not None:
+        print(cache.summary())